@@ -17,23 +17,106 @@ class Config:
     QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
     QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "simplybot_docs")
+    QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))  # sekundy
     
     # ElevenLabs
     ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
     ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  
+    ELEVENLABS_MODEL = os.getenv("ELEVENLABS_MODEL", "eleven_multilingual_v2")
+    TTS_BACKEND = os.getenv("TTS_BACKEND", "elevenlabs")  # "elevenlabs" lub "local" (ton WAV do testów offline)
+    TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))  # wątki dla blokujących wywołań TTS
+    TTS_LOCAL_LATENCY = float(os.getenv("TTS_LOCAL_LATENCY", "0"))  # sekundy - symulowany czas odpowiedzi backendu local
+    TTS_SENTENCE_PIPELINE = os.getenv("TTS_SENTENCE_PIPELINE", "true").lower() == "true"  # dłuższe teksty renderowane zdaniami równolegle
+    TTS_SEGMENT_MIN_CHARS = int(os.getenv("TTS_SEGMENT_MIN_CHARS", "40"))  # krótsze zdania są łączone z następnym
+    AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))  # limit rozmiaru static/audio
+    AUDIO_CACHE_SWEEP_INTERVAL = float(os.getenv("AUDIO_CACHE_SWEEP_INTERVAL", "60"))  # sekundy między sprawdzeniami limitu
+    AUDIO_INDEX_DB = os.getenv("AUDIO_INDEX_DB", "cache/audio_index.sqlite3")
+    AUDIO_JOBS_MAX = int(os.getenv("AUDIO_JOBS_MAX", "1000"))  # zadania audio pamiętane do odpytywania
+    AUDIO_JOB_TIMEOUT = float(os.getenv("AUDIO_JOB_TIMEOUT", "120"))  # sekundy oczekiwania na audio w SSE
     
     # App settings
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", "1000"))
     TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
     
+    # Routing modeli: szybki model do klasyfikacji/podsumowań, mocny do odpowiedzi
+    SUMMARIZE_MODEL = os.getenv("SUMMARIZE_MODEL", "")  # pusty = gpt-4o-mini u bieżącego dostawcy
+    SUMMARIZE_MAX_TOKENS = int(os.getenv("SUMMARIZE_MAX_TOKENS", "300"))
+    SUMMARIZE_TEMPERATURE = float(os.getenv("SUMMARIZE_TEMPERATURE", "0.0"))
+    SUMMARIZE_TIMEOUT = float(os.getenv("SUMMARIZE_TIMEOUT", "15"))  # sekundy
+    ANSWER_MODEL = os.getenv("ANSWER_MODEL", "")  # pusty = OPENROUTER_MODEL / OPENAI_MODEL
+    ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", str(MAX_TOKENS)))
+    ANSWER_TEMPERATURE = float(os.getenv("ANSWER_TEMPERATURE", str(TEMPERATURE)))
+    ANSWER_TIMEOUT = float(os.getenv("ANSWER_TIMEOUT", "60"))  # sekundy
+    
+    # Odporność wywołań LLM: limit współbieżności, rate limit, ponowienia, hedging
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # równoczesne zapytania do dostawcy
+    LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "10"))  # zapytań/s, 0 = bez limitu (spada po 429)
+    LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # ponowienia po 429/5xx/timeoucie
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # sekundy
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # sekundy
+    LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"  # drugie zapytanie po p95 (kosztuje tokeny)
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))  # sekundy
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # pomiary potrzebne do wyznaczenia p95
+    
     # Embedding settings
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "openai")
     BGE_MODEL_NAME = os.getenv("BGE_MODEL_NAME", "BAAI/bge-m3")
     OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-large")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))  # wątki dla lokalnego modelu BGE
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))  # wpisy w pamięci
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "604800"))  # sekundy (7 dni)
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")  # pusty = tylko pamięć
+    EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "200000"))  # limit wpisów na dysku
+    EMBEDDING_CACHE_PRUNE_INTERVAL = float(os.getenv("EMBEDDING_CACHE_PRUNE_INTERVAL", "300"))  # sekundy między czyszczeniami
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))  # 0 wyłącza cache odpowiedzi
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # sekundy
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # minimalne podobieństwo cosinusowe
+    
+    # Lokalny klasyfikator intencji (pomija LLM przy pewnych, jednoturowych wiadomościach)
+    INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true"
+    INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.05"))  # minimalna przewaga najbliższego centroidu
+    
+    # Pakowanie kontekstu odpowiedzi
+    RETRIEVAL_LIMIT = int(os.getenv("RETRIEVAL_LIMIT", "5"))  # fragmenty pobierane z Qdrant
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))  # budżet tokenów kontekstu w prompcie
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.9"))  # podobieństwo Jaccarda prawie-duplikatów
+    
+    # Spekulatywne wyszukiwanie na surowej wiadomości równolegle z podsumowaniem rozmowy
+    SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+    SPECULATIVE_SIMILARITY_THRESHOLD = float(os.getenv("SPECULATIVE_SIMILARITY_THRESHOLD", "0.9"))
+    METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))  # liczba ostatnich pomiarów dla p50/p95
+    
+    # Sesje rozmów po stronie serwera (kroczące podsumowanie + ostatnie wiadomości)
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))  # sekundy bez aktywności
+    SESSION_RECENT_MESSAGES = int(os.getenv("SESSION_RECENT_MESSAGES", "6"))  # wiadomości przekazywane dosłownie
+    
+    # Qdrant ingestion
+    QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+    MANIFEST_DIR = os.getenv("MANIFEST_DIR", "cache/manifests")
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))  # równoległe zadania indeksowania
+    INGESTION_JOBS_DB = os.getenv("INGESTION_JOBS_DB", "cache/ingestion_jobs.sqlite3")
+    INGESTION_STAGING_DIR = os.getenv("INGESTION_STAGING_DIR", "cache/ingestion")
+    PIPELINE_EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", "2"))
+    PIPELINE_UPSERT_WORKERS = int(os.getenv("PIPELINE_UPSERT_WORKERS", "2"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # paczek w kolejce między etapami
     
     # File upload settings
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
     MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "10"))  # MB 
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # bajty odczytywane na raz
+    
+    # Document extraction settings
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0"))  # 0 = liczba rdzeni
+    PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
+    TXT_BLOCK_BYTES = int(os.getenv("TXT_BLOCK_BYTES", str(1024 * 1024)))  # blok TXT kończy się na granicy akapitu
+    DOCX_PARAGRAPHS_PER_SHARD = int(os.getenv("DOCX_PARAGRAPHS_PER_SHARD", "500"))
+    
+    # Chunking settings (tokeny liczone tokenizerem modelu embeddings)
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
 
 
 if __name__ == "__main__":
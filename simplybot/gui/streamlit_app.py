@@ -2,7 +2,8 @@ import streamlit as st
 import requests
 import json
 import os
-import base64
+import time
+import uuid
 from datetime import datetime
 from typing import List, Dict, Any
 import tempfile
@@ -17,6 +18,8 @@ st.set_page_config(
 
 # Konfiguracja API
 API_BASE_URL = "http://localhost:8000"
+# Adres API widziany z przeglądarki - audio jest odtwarzane bezpośrednio z serwera (streaming, Range, cache)
+AUDIO_PUBLIC_URL = os.getenv("AUDIO_PUBLIC_URL", API_BASE_URL)
 
 def check_api_health():
     """Checks API status"""
@@ -38,21 +41,110 @@ def upload_documents(files):
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-def get_more_information(conversation):
-    """Sends conversation to API and receives response"""
+def get_ingestion_job(job_id):
+    """Retrieves ingestion job progress"""
     try:
-        payload = {
-            "conversation": {
-                "messages": conversation,
-                "session_id": st.session_state.get("session_id", "default")
-            }
+        response = requests.get(f"{API_BASE_URL}/ingestion/jobs/{job_id}")
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except Exception:
+        return None
+
+def wait_for_ingestion_job(job_id, timeout=600):
+    """Polls ingestion job and shows its progress"""
+    progress_bar = st.progress(0.0, text=f"Job {job_id}: queued")
+    started_at = time.time()
+    job = None
+    while time.time() - started_at < timeout:
+        job = get_ingestion_job(job_id)
+        if job:
+            files_total = max(job["files_total"], 1)
+            progress_bar.progress(
+                min(job["files_done"] / files_total, 1.0),
+                text=(
+                    f"Job {job_id}: {job['status']} - files {job['files_done']}/{job['files_total']}, "
+                    f"chunks {job['points_upserted']}/{job['chunks_total']} ({job['chunks_per_s']} chunks/s)"
+                )
+            )
+            if job["status"] in ("completed", "failed"):
+                return job
+        time.sleep(1)
+    return job
+
+def _conversation_payload(conversation, full=False):
+    """Builds request payload - the server keeps session history, so only the new user message is sent.
+    
+    The first message of a session and a resync after 409 send the full transcript instead.
+    """
+    full = full or len(conversation) <= 1
+    return {
+        "conversation": {
+            "messages": [{"role": msg["role"], "content": msg["content"]} for msg in (conversation if full else conversation[-1:])],
+            "session_id": st.session_state.get("session_id", "default"),
+            "is_delta": not full
         }
-        
-        response = requests.post(f"{API_BASE_URL}/get_more_information", json=payload)
-        return response.json()
+    }
+
+def _needs_resync(response):
+    """True when the server does not know the session (expired, restarted, other worker)"""
+    return response.status_code == 409 and response.json().get("resync", False)
+
+def _stream_attempt(conversation, placeholder, full):
+    """Reads one SSE response; returns None when the server asks for a resync (409 or "error" event)"""
+    result = {"answer": "", "audio_url": None, "sources": []}
+    response = requests.post(f"{API_BASE_URL}/get_more_information/stream", json=_conversation_payload(conversation, full=full), stream=True, timeout=300)
+    with response:
+        if not full and _needs_resync(response):
+            return None
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):].strip())
+                if event == "sources":
+                    result["sources"] = data["sources"]
+                    result["confidence"] = data["confidence"]
+                elif event == "token":
+                    result["answer"] += data["text"]
+                    placeholder.markdown(result["answer"] + "▌")
+                elif event == "done":
+                    # Audio arrives later - the answer is complete, so stop reading here
+                    result.update(data)
+                    break
+                elif event == "error":
+                    if not full and data.get("resync", False):
+                        return None
+                    result["answer"] = f"Błąd: {data['detail']}"
+    return result
+
+def stream_more_information(conversation, placeholder):
+    """Streams bot response (SSE) and renders tokens as they arrive"""
+    try:
+        result = _stream_attempt(conversation, placeholder, full=False)
+        if result is None:
+            # Server lost the session - resend the whole conversation
+            result = _stream_attempt(conversation, placeholder, full=True)
+        placeholder.empty()
+        return result
     except Exception as e:
+        placeholder.empty()
         return {"answer": f"Błąd: {str(e)}", "audio_url": None}
 
+def render_audio_player(audio_url, autoplay=False):
+    """Audio player streaming straight from the API - playback starts before the whole file is downloaded"""
+    st.markdown(
+        f"""
+        <audio controls {"autoplay" if autoplay else ""} preload="auto" style="width: 100%; margin: 10px 0;">
+            <source src="{AUDIO_PUBLIC_URL}{audio_url}">
+            Your browser doesn't support audio playback.
+        </audio>
+        """,
+        unsafe_allow_html=True
+    )
+
 def get_documents_info():
     """Retrieves document information"""
     try:
@@ -72,14 +164,6 @@ def generate_audio_from_text(text):
         response = requests.post(f"{API_BASE_URL}/generate-audio", json={"text": text})
         result = response.json()
         
-        if result.get("audio_url"):
-            # Wyciągnij nazwę pliku z URL
-            filename = result["audio_url"].split("/")[-1]
-            # Pobierz plik audio jako bytes
-            audio_response = requests.get(f"{API_BASE_URL}/audio/{filename}")
-            if audio_response.status_code == 200:
-                return {"audio_bytes": audio_response.content, "audio_url": result["audio_url"]}
-        
         return result
     except Exception as e:
         return {"audio_url": None, "error": str(e)}
@@ -96,7 +180,7 @@ def chat_with_json(json_data):
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "session_id" not in st.session_state:
-    st.session_state.session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    st.session_state.session_id = uuid.uuid4().hex
 if "example_json" not in st.session_state:
     st.session_state.example_json = ""
 
@@ -154,13 +238,23 @@ with st.sidebar:
     )
     
     if uploaded_files and st.button("Upload documents"):
-        with st.spinner("Processing documents..."):
+        with st.spinner("Uploading documents..."):
             result = upload_documents(uploaded_files)
-            if result.get("success"):
-                st.success(result["message"])
+        if result.get("success") and result.get("job_id"):
+            st.info(f"📥 {result['message']}")
+            job = wait_for_ingestion_job(result["job_id"])
+            if job and job["status"] == "completed":
+                st.success(f"✅ Indexed {job['points_upserted']} fragments from {job['files_done']} files")
                 st.rerun()
+            elif job and job["status"] == "failed":
+                st.error("; ".join(job["errors"]) or "Ingestion failed")
             else:
-                st.error(result["message"])
+                st.warning(f"⏳ Job {result['job_id']} is still running")
+        elif result.get("success"):
+            st.success(result["message"])
+            st.rerun()
+        else:
+            st.error(result.get("message") or result.get("detail"))
     
 
 
@@ -191,40 +285,12 @@ with tab1:
             else:
                 st.write(content)
             
-            # Display audio if available
+            # Display audio if available (served from the browser cache on repeat plays)
             if message.get("audio_url"):
-                try:
-                    # Extract filename from URL
-                    filename = message["audio_url"].split("/")[-1]
-                    # Try to download audio file
-                    audio_response = requests.get(f"{API_BASE_URL}/audio/{filename}")
-                    if audio_response.status_code == 200:
-                        # Automatic audio playback for history
-                        audio_base64 = base64.b64encode(audio_response.content).decode('utf-8')
-                        st.markdown(
-                            f"""
-                            <audio controls style="width: 100%; margin: 10px 0;">
-                                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                                Your browser doesn't support audio playback.
-                            </audio>
-                            """,
-                            unsafe_allow_html=True
-                        )
-                        # Button for replay
-                        if st.button("🔊 Play again", key=f"replay_{message.get('id', 'unknown')}"):
-                            st.markdown(
-                                f"""
-                                <audio controls autoplay style="width: 100%; margin: 10px 0;">
-                                    <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                                    Your browser doesn't support audio playback.
-                                </audio>
-                                """,
-                                unsafe_allow_html=True
-                            )
-                    else:
-                        st.warning("⚠️ Audio file unavailable")
-                except:
-                    st.warning("⚠️ Audio file unavailable")
+                render_audio_player(message["audio_url"])
+                # Button for replay
+                if st.button("🔊 Play again", key=f"replay_{message.get('id', 'unknown')}"):
+                    render_audio_player(message["audio_url"], autoplay=True)
 
 with tab2:
     st.header("📊 JSON Analysis with LLM")
@@ -285,32 +351,10 @@ with tab2:
                                 else:
                                     audio_response = generate_audio_from_text(answer_text)
                                 
-                                if audio_response.get("audio_bytes"):
+                                if audio_response.get("audio_url"):
                                     st.success("✅ Audio wygenerowane dla TLDR!")
-                                    # Automatyczne odtwarzanie audio
-                                    st.audio(
-                                        audio_response["audio_bytes"], 
-                                        format="audio/mp3",
-                                        start_time=0
-                                    )
-                                    # Automatyczne odtwarzanie przez HTML
-                                    audio_base64 = base64.b64encode(audio_response['audio_bytes']).decode('utf-8')
-                                    st.markdown(
-                                        f"""
-                                        <audio controls autoplay style="width: 100%; margin: 10px 0;">
-                                            <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                                            Twoja przeglądarka nie obsługuje odtwarzania audio.
-                                        </audio>
-                                        """,
-                                        unsafe_allow_html=True
-                                    )
-                                elif audio_response.get("audio_url"):
-                                    st.success("✅ Audio wygenerowane!")
-                                    st.audio(
-                                        audio_response["audio_url"], 
-                                        format="audio/mp3",
-                                        start_time=0
-                                    )
+                                    # Automatyczne odtwarzanie audio prosto z API
+                                    render_audio_player(audio_response["audio_url"], autoplay=True)
                                 else:
                                     st.error("❌ Błąd generowania audio")
                     else:
@@ -364,82 +408,68 @@ if prompt := st.chat_input("Write a message..."):
     
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Bot is thinking..."):
-            response = get_more_information(st.session_state.messages)
+        # Tokens are rendered as they arrive, then replaced by the formatted answer
+        stream_placeholder = st.empty()
+        stream_placeholder.markdown("Bot is thinking...")
+        response = stream_more_information(st.session_state.messages, stream_placeholder)
+        if "answer" in response:
+            # Check if response requires clarification
+            if response.get("needs_clarification", False):
+                st.warning("🤔 Bot needs more information:")
+                st.info(f"**Confidence:** {response.get('confidence', 0):.1%}")
             
-            if "answer" in response:
-                # Check if response requires clarification
-                if response.get("needs_clarification", False):
-                    st.warning("🤔 Bot needs more information:")
-                    st.info(f"**Confidence:** {response.get('confidence', 0):.1%}")
-                
-                # Check if response has TLDR + Description format
-                answer_text = response["answer"]
-                if "**TLDR:**" in answer_text and "**Description:**" in answer_text:
-                    # Split response into TLDR and Description
-                    parts = answer_text.split("**Description:**")
-                    if len(parts) == 2:
-                        tldr_part = parts[0].replace("**TLDR:**", "").strip()
-                        description_part = parts[1].strip()
-                        
-                        # Display TLDR in color
-                        st.markdown(f"**📋 TLDR:** {tldr_part}")
-                        st.markdown("---")
-                        st.markdown(f"**📖 Description:** {description_part}")
-                        st.info("💡 Audio is generated only for TLDR part")
-                    else:
-                        st.write(answer_text)
+            # Check if response has TLDR + Description format
+            answer_text = response["answer"]
+            if "**TLDR:**" in answer_text and "**Description:**" in answer_text:
+                # Split response into TLDR and Description
+                parts = answer_text.split("**Description:**")
+                if len(parts) == 2:
+                    tldr_part = parts[0].replace("**TLDR:**", "").strip()
+                    description_part = parts[1].strip()
+                    
+                    # Display TLDR in color
+                    st.markdown(f"**📋 TLDR:** {tldr_part}")
+                    st.markdown("---")
+                    st.markdown(f"**📖 Description:** {description_part}")
+                    st.info("💡 Audio is generated only for TLDR part")
                 else:
                     st.write(answer_text)
-                
-                # Add response to history
-                bot_message = {
-                    "role": "assistant", 
-                    "content": response["answer"],
-                    "audio_url": response.get("audio_url")
-                }
-                st.session_state.messages.append(bot_message)
-                
-                # Display audio if available
-                if response.get("audio_url"):
-                    try:
-                        # Extract filename from URL
-                        filename = response["audio_url"].split("/")[-1]
-                        # Try to download audio file
-                        audio_response = requests.get(f"{API_BASE_URL}/audio/{filename}")
-                        if audio_response.status_code == 200:
-                            # Automatic audio playback
-                            audio_base64 = base64.b64encode(audio_response.content).decode('utf-8')
-                            st.markdown(
-                                f"""
-                                <audio controls autoplay style="width: 100%; margin: 10px 0;">
-                                    <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                                    Your browser doesn't support audio playback.
-                                </audio>
-                                """,
-                                unsafe_allow_html=True
-                            )
-                        else:
-                            st.warning("⚠️ Audio file unavailable")
-                    except:
-                        st.warning("⚠️ Audio file unavailable")
-                
-                # Display sources if available
-                if response.get("sources"):
-                    with st.expander("📚 Sources"):
-                        for i, source in enumerate(response["sources"]):
-                            st.markdown(f"**Source {i+1}:**")
-                            st.write(f"Fragment: {source['content']}")
-                            if source.get("metadata"):
-                                st.write(f"File: {source['metadata'].get('source', 'Unknown')}")
-                            st.write(f"Relevance: {source.get('score', 0):.2f}")
-                            st.divider()
             else:
-                st.error("Error generating response")
+                st.write(answer_text)
+            
+            # Audio is generated in the background - the stream URL plays it while TTS is still writing it
+            audio_url = response.get("audio_url") or response.get("audio_stream_url")
+            
+            # Add response to history
+            bot_message = {
+                "role": "assistant", 
+                "content": response["answer"],
+                "audio_url": audio_url
+            }
+            st.session_state.messages.append(bot_message)
+            
+            # Display audio if available
+            if audio_url:
+                render_audio_player(audio_url, autoplay=True)
+            
+            # Display sources if available
+            if response.get("sources"):
+                with st.expander("📚 Sources"):
+                    for i, source in enumerate(response["sources"]):
+                        st.markdown(f"**Source {i+1}:**")
+                        st.write(f"Fragment: {source['content']}")
+                        if source.get("metadata"):
+                            st.write(f"File: {source['metadata'].get('source', 'Unknown')}")
+                        st.write(f"Relevance: {source.get('score', 0):.2f}")
+                        st.divider()
+        else:
+            st.error("Error generating response")
 
 # Clear history button
 if st.button("🗑️ Clear history"):
     st.session_state.messages = []
+    # New session on the server as well
+    st.session_state.session_id = uuid.uuid4().hex
     st.rerun()
 
 # Session information
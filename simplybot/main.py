@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from qdrant_client import QdrantClient
 from simplybot.models import (
     GetMoreInformationRequest, 
     GetMoreInformationResponse,
@@ -11,20 +11,40 @@ from simplybot.models import (
     FileListResponse,
     FileUploadResponse,
     ConversationSummaryResponse,
-    ConversationSummaryRequest
+    ConversationSummaryRequest,
+    IngestionFileProgress,
+    IngestionJob,
+    IngestionJobListResponse,
+    AudioJobResponse
 )
 from simplybot.services.llm_service import LLMService
 from simplybot.services.vector_store import VectorStoreService
 from simplybot.services.audio_service import AudioService
+from simplybot.services.audio_jobs import AudioJobManager
+from simplybot.services.audio_store import RangeNotSatisfiableError, parse_byte_range
 from simplybot.services.document_processor import DocumentProcessor
+from simplybot.services.ingestion_manifest import file_sha256
+from simplybot.services.ingestion_jobs import IngestionJobManager
+from simplybot.services.ingestion_pipeline import IngestionPipeline
+from simplybot.services.semantic_cache import SemanticCache, CachedAnswer
+from simplybot.services.intent_classifier import IntentClassifier
+from simplybot.services.metrics import MetricsRegistry
+from simplybot.services.session_store import SessionStore, UnknownSessionError
+from simplybot.services.resilience import UpstreamUnavailableError
 from simplybot.config import Config
+import asyncio
 import logging
 import os
 from datetime import datetime
-from typing import List, Dict
-import tempfile
+from typing import List, Dict, Tuple, Callable, Optional, AsyncIterator
+import hashlib
+import shutil
+import uuid
 from pathlib import Path
 import json
+import time
+import numpy as np
+from pydantic import ValidationError
 
 # Konfiguracja logowania
 logging.basicConfig(level=logging.INFO)
@@ -56,7 +76,48 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 llm_service = LLMService()
 vector_store = VectorStoreService()
 audio_service = AudioService()
+audio_jobs = AudioJobManager(audio_service, max_jobs=Config.AUDIO_JOBS_MAX)
 document_processor = DocumentProcessor()
+request_metrics = MetricsRegistry(window=Config.METRICS_WINDOW)
+session_store = SessionStore(
+    summarize=llm_service.update_rolling_summary,
+    max_sessions=Config.SESSION_MAX_SESSIONS,
+    ttl_seconds=Config.SESSION_TTL,
+    max_recent_messages=Config.SESSION_RECENT_MESSAGES
+)
+intent_classifier = IntentClassifier(
+    # Centroidy embeddingów tylko z lokalnym modelem (BGE) - z OpenAI byłoby to wywołanie sieciowe na wiadomość
+    embed=vector_store.embed_query if vector_store.embedding_model == "bge" else None,
+    min_margin=Config.INTENT_MIN_MARGIN,
+    enabled=Config.INTENT_CLASSIFIER_ENABLED
+)
+semantic_cache = SemanticCache(
+    max_size=Config.SEMANTIC_CACHE_SIZE,
+    ttl_seconds=Config.SEMANTIC_CACHE_TTL,
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD
+)
+ingestion_pipeline = IngestionPipeline(
+    vector_store,
+    embed_workers=Config.PIPELINE_EMBED_WORKERS,
+    upsert_workers=Config.PIPELINE_UPSERT_WORKERS,
+    queue_size=Config.PIPELINE_QUEUE_SIZE
+)
+
+@app.on_event("startup")
+async def startup():
+    """Initializes async resources"""
+    await vector_store.initialize()
+    await ingestion_jobs.start()
+    await audio_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Releases async resources"""
+    await ingestion_jobs.stop()
+    await vector_store.close()
+    document_processor.shutdown()
+    await audio_jobs.stop()
+    await audio_service.stop()
 
 @app.get("/", response_model=HealthCheckResponse)
 async def health_check():
@@ -76,9 +137,8 @@ async def health_check():
     
     # Check Qdrant
     try:
-        # First check if server is running
-        client = QdrantClient(url=Config.QDRANT_URL)
-        collections = client.get_collections()
+        # First check if server is running (shared async client)
+        await vector_store.client.get_collections()
         services["qdrant"] = "ok"
         
         # Additionally check collection (optional)
@@ -118,99 +178,425 @@ async def health_check():
         services=services
     )
 
+def _session_context(request: GetMoreInformationRequest) -> Tuple[str, List[Dict[str, str]]]:
+    """Converts conversation to LLM format - with a session_id only the rolling summary and recent turns are used"""
+    conversation = request.conversation
+    messages = [{"role": msg.role, "content": msg.content} for msg in conversation.messages]
+    if conversation.session_id is None:
+        if conversation.is_delta:
+            raise HTTPException(status_code=400, detail="session_id is required when sending delta messages")
+        return "", messages
+    return session_store.update(conversation.session_id, messages, conversation.is_delta)
+
+def _require_session(request: GetMoreInformationRequest):
+    """Rejects a delta for a session this worker does not know before a streaming response starts"""
+    conversation = request.conversation
+    if conversation.is_delta and conversation.session_id is not None:
+        session_store.require(conversation.session_id)
+
+@app.exception_handler(UnknownSessionError)
+async def unknown_session_handler(request: Request, error: UnknownSessionError):
+    """409 with "resync": true - the client should resend the full conversation with is_delta=false"""
+    logger.warning(f"🔄 {error}")
+    return JSONResponse(status_code=409, content={"detail": str(error), "resync": True})
+
+def _remember_answer(request: GetMoreInformationRequest, answer: str):
+    """Stores the bot answer in the session so clients only need to send new messages"""
+    session_store.add_message(request.conversation.session_id, "assistant", answer)
+
+def _upstream_unavailable(error: UpstreamUnavailableError) -> HTTPException:
+    """503 with Retry-After when the LLM provider stays rate-limited or down after retries"""
+    retry_after = max(1, int(error.retry_after or Config.LLM_RETRY_MAX_DELAY))
+    return HTTPException(
+        status_code=503,
+        detail="LLM provider temporarily unavailable - please retry",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def _summarize(conversation_messages: List[Dict[str, str]], rolling_summary: str = ""):
+    """Local intent classifier first (fresh conversations only); the LLM summarizer when it is unsure"""
+    conversation_summary = None
+    if not rolling_summary:
+        conversation_summary = await intent_classifier.classify(conversation_messages)
+    if conversation_summary is None:
+        conversation_summary = await llm_service.summarize_conversation(conversation_messages, rolling_summary)
+    return conversation_summary
+
+def _start_speculative_search(conversation_messages: List[Dict[str, str]]) -> Optional[asyncio.Task]:
+    """Starts retrieval on the raw last user message while the conversation is being summarized"""
+    if not Config.SPECULATIVE_RETRIEVAL:
+        return None
+    raw_message = next((msg["content"] for msg in reversed(conversation_messages) if msg["role"] == "user"), "").strip()
+    if len(raw_message) < 3:
+        return None
+    
+    async def search():
+        raw_vector = await vector_store.embed_query(raw_message)
+        return raw_message, raw_vector, await vector_store.search_documents(raw_message, limit=Config.RETRIEVAL_LIMIT, query_vector=raw_vector)
+    
+    request_metrics.increment("speculative.started")
+    return asyncio.create_task(search())
+
+def _cancel_speculative_search(speculative_search: Optional[asyncio.Task]):
+    """Cancels a still-running speculative search; a finished one is left as is"""
+    if speculative_search is None:
+        return
+    if speculative_search.done():
+        # Mark a failure as retrieved so an unused result does not log "Task exception was never retrieved"
+        if not speculative_search.cancelled():
+            speculative_search.exception()
+        return
+    speculative_search.cancel()
+    request_metrics.increment("speculative.cancelled")
+
+async def _retrieve(question: str, query_vector: List[float], speculative_search: Optional[asyncio.Task]) -> List[Dict]:
+    """Returns context documents, reusing speculative results when rag_query is close to the raw message"""
+    if speculative_search is None:
+        return await vector_store.search_documents(question, limit=Config.RETRIEVAL_LIMIT, query_vector=query_vector)
+    
+    try:
+        raw_message, raw_vector, speculative_docs = await speculative_search
+    except Exception as e:
+        logger.warning(f"⚠️ Speculative search failed: {e}")
+        request_metrics.increment("speculative.failed")
+        return await vector_store.search_documents(question, limit=Config.RETRIEVAL_LIMIT, query_vector=query_vector)
+    
+    similarity = 1.0 if raw_message == question else float(
+        np.dot(raw_vector, query_vector) / (np.linalg.norm(raw_vector) * np.linalg.norm(query_vector))
+    )
+    if similarity >= Config.SPECULATIVE_SIMILARITY_THRESHOLD:
+        logger.info(f"⚡ Reusing speculative search results (similarity: {similarity:.4f})")
+        request_metrics.increment("speculative.reused")
+        return speculative_docs
+    
+    logger.info(f"🔁 rag_query diverged from raw message (similarity: {similarity:.4f}) - searching again")
+    request_metrics.increment("speculative.discarded")
+    context_docs = await vector_store.search_documents(question, limit=Config.RETRIEVAL_LIMIT, query_vector=query_vector)
+    # Overlap of discarded results with the final ones - used to tune SPECULATIVE_SIMILARITY_THRESHOLD
+    speculative_ids = {doc.get("id") for doc in speculative_docs}
+    final_ids = {doc.get("id") for doc in context_docs}
+    if speculative_ids | final_ids:
+        request_metrics.record("speculative.discarded_overlap_pct", 100 * len(speculative_ids & final_ids) / len(speculative_ids | final_ids))
+    return context_docs
+
+def _format_sources(context_docs: List[Dict]) -> List[Dict]:
+    """Prepares document previews returned as sources"""
+    return [
+        {
+            "content": doc.get("content", "")[:200] + "...",
+            "metadata": doc.get("metadata", {}),
+            "score": doc.get("score", 0)
+        }
+        for doc in context_docs
+    ]
+
+def _clarification_answer(conversation_summary) -> str:
+    return f"**TLDR:** {conversation_summary.rag_query}\n\n**Opis:** {conversation_summary.conversation_summary}"
+
+def _cache_answer(
+    question: str,
+    query_vector: List[float],
+    collection_version: int,
+    answer: str,
+    context_docs: List[Dict],
+    sources: List[Dict],
+    confidence: float,
+    started_at: float
+):
+    """Stores a generated answer in the semantic cache (answers without context are not cached)"""
+    if not context_docs or answer == "I don't have information":
+        return
+    semantic_cache.store(query_vector, collection_version, CachedAnswer(
+        rag_query=question,
+        answer=answer,
+        point_ids=[doc["id"] for doc in context_docs],
+        sources=sources,
+        confidence=confidence,
+        latency_ms=(time.perf_counter() - started_at) * 1000
+    ))
+
+def _tldr_text(answer: str) -> str:
+    """Extracts the TLDR part of an answer (the whole answer if it has no TLDR)"""
+    if "**TLDR:**" in answer:
+        tldr_part = answer.split("**Description:**")[0]
+        tldr_text = tldr_part.replace("**TLDR:**", "").strip()
+        logger.info(f"📋 TLDR for audio: '{tldr_text[:50]}...'")
+        return tldr_text
+    # If no TLDR format, use entire response
+    logger.info(f"📋 Using entire response for audio: '{answer[:50]}...'")
+    return answer
+
+async def _start_tldr_audio(answer: str) -> Dict[str, Optional[str]]:
+    """Starts TLDR audio in the background - returns audio_url (if already cached), audio_job_id and audio_stream_url"""
+    if not audio_service.enabled:
+        logger.info("⚠️ Skipping audio generation - no ElevenLabs key")
+        return {"audio_url": None, "audio_job_id": None, "audio_stream_url": None}
+    
+    job = await audio_jobs.submit(_tldr_text(answer))
+    logger.info(f"🎵 TLDR audio job {job.job_id}: {job.status.value}")
+    return {"audio_url": job.audio_url, "audio_job_id": job.job_id, "audio_stream_url": job.stream_url}
+
 @app.post("/get_more_information", response_model=GetMoreInformationResponse)
 async def get_more_information(request: GetMoreInformationRequest):
     """Main endpoint for bot conversation handling"""
     try:
         logger.info(f"🚀 Starting request processing (session: {request.conversation.session_id})")
         
-        # 1. Convert conversation to LLM format
-        conversation_messages = []
-        for msg in request.conversation.messages:
-            conversation_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        # 1. Convert conversation to LLM format (server-side session keeps a rolling summary of older turns)
+        rolling_summary, conversation_messages = _session_context(request)
+        logger.info(f"💬 Conversation contains {len(conversation_messages)} recent messages (rolling summary: {'yes' if rolling_summary else 'no'})")
         
-        logger.info(f"💬 Conversation contains {len(conversation_messages)} messages")
-        
-        # 2. Summarize conversation and prepare RAG query
+        # 2. Summarize conversation and prepare RAG query (retrieval on the raw message may already be running)
         logger.info("🧠 STEP 1: Summarizing conversation...")
-        conversation_summary = await llm_service.summarize_conversation(conversation_messages)
+        started_at = time.perf_counter()
+        speculative_search = _start_speculative_search(conversation_messages)
+        mode = "speculative" if speculative_search else "sequential"
+        # The speculative search must not outlive the request (errors, early returns)
+        try:
+            with request_metrics.timer(f"{mode}.summarize_ms"):
+                conversation_summary = await _summarize(conversation_messages, rolling_summary)
         
-        logger.info(f"📊 Summary: {conversation_summary.next_action} (confidence: {conversation_summary.confidence})")
-        logger.info(f"💭 Reasoning: {conversation_summary.reasoning}")
+            logger.info(f"📊 Summary: {conversation_summary.next_action} (confidence: {conversation_summary.confidence})")
+            logger.info(f"💭 Reasoning: {conversation_summary.reasoning}")
         
-        # Check if user needs to be asked for more
-        if conversation_summary.next_action.value == "ask_user":
-            logger.info("🤔 Conversation requires user follow-up")
-            return GetMoreInformationResponse(
-                answer=f"**TLDR:** {conversation_summary.rag_query}\n\n**Opis:** {conversation_summary.conversation_summary}",
-                audio_url=None,
-                confidence=conversation_summary.confidence,
-                sources=[],
-                needs_clarification=True
-            )
+            # Check if user needs to be asked for more
+            if conversation_summary.next_action.value == "ask_user":
+                logger.info("🤔 Conversation requires user follow-up")
+                _cancel_speculative_search(speculative_search)
+                answer = _clarification_answer(conversation_summary)
+                _remember_answer(request, answer)
+                return GetMoreInformationResponse(
+                    answer=answer,
+                    audio_url=None,
+                    confidence=conversation_summary.confidence,
+                    sources=[],
+                    needs_clarification=True
+                )
         
-        # 3. Search documents in Qdrant
-        logger.info("🔍 STEP 2: Searching documents in Qdrant...")
-        question = conversation_summary.rag_query
-        question_preview = question[:10] + "..." if len(question) > 10 else question
-        logger.info(f"❓ RAG question: '{question_preview}'")
+            # 3. Search documents in Qdrant
+            logger.info("🔍 STEP 2: Searching documents in Qdrant...")
+            question = conversation_summary.rag_query
+            question_preview = question[:10] + "..." if len(question) > 10 else question
+            logger.info(f"❓ RAG question: '{question_preview}'")
         
-        context_docs = await vector_store.search_documents(question, limit=5)
+            # Semantic cache - a near-identical rag_query reuses the previous answer
+            query_vector = await vector_store.embed_query(question)
+            collection_version = await vector_store.get_collection_version()
+            cached = semantic_cache.lookup(query_vector, collection_version)
+            if cached:
+                _cancel_speculative_search(speculative_search)
+                _remember_answer(request, cached.answer)
+                audio = await _start_tldr_audio(cached.answer)
+                return GetMoreInformationResponse(
+                    answer=cached.answer,
+                    confidence=conversation_summary.confidence,
+                    sources=cached.sources,
+                    needs_clarification=False,
+                    cached=True,
+                    **audio
+                )
+            generation_started_at = time.perf_counter()
         
-        # 4. Generate response with context
-        logger.info("🤖 STEP 3: Generating response with context...")
-        answer = await llm_service.answer_with_context(question, context_docs)
+            with request_metrics.timer(f"{mode}.retrieval_wait_ms"):
+                context_docs = await _retrieve(question, query_vector, speculative_search)
         
-        # 5. Generate audio only for TLDR (optional)
-        audio_url = None
-        if Config.ELEVENLABS_API_KEY:
-            logger.info("🎵 STEP 4: Generating audio for TLDR...")
-            
-            # Extract TLDR from response
-            tldr_text = ""
-            if "**TLDR:**" in answer:
-                tldr_part = answer.split("**Opis:**")[0]
-                tldr_text = tldr_part.replace("**TLDR:**", "").strip()
-                logger.info(f"📋 TLDR for audio: '{tldr_text[:50]}...'")
-            else:
-                # If no TLDR format, use entire response
-                tldr_text = answer
-                logger.info(f"📋 Using entire response for audio: '{tldr_text[:50]}...'")
-            
-            audio_url = await audio_service.generate_speech(tldr_text)
-            if audio_url:
-                logger.info(f"✅ Audio generated for TLDR: {audio_url}")
-            else:
-                logger.warning("⚠️ Failed to generate audio")
-        else:
-            logger.info("⚠️ Skipping audio generation - no ElevenLabs key")
-        
-        # 6. Prepare sources
-        sources = []
-        for doc in context_docs:
-            sources.append({
-                "content": doc.get("content", "")[:200] + "...",
-                "metadata": doc.get("metadata", {}),
-                "score": doc.get("score", 0)
-            })
+            # 4. Generate response with context
+            logger.info("🤖 STEP 3: Generating response with context...")
+            with request_metrics.timer("answer_ms"):
+                answer = await llm_service.answer_with_context(question, context_docs)
         
-        logger.info(f"🎉 Processing completed - response ready (audio: {'yes' if audio_url else 'no'})")
+            # 5. Audio only for TLDR (optional) - generated in the background, the answer does not wait for it
+            logger.info("🎵 STEP 4: Audio for TLDR...")
+            audio = await _start_tldr_audio(answer)
         
-        return GetMoreInformationResponse(
-            answer=answer,
-            audio_url=audio_url,
-            confidence=conversation_summary.confidence,
-            sources=sources,
-            needs_clarification=False
-        )
+            # 6. Prepare sources
+            sources = _format_sources(context_docs)
+            _cache_answer(
+                question, query_vector, collection_version, answer,
+                context_docs, sources, conversation_summary.confidence, generation_started_at
+            )
+        
+            _remember_answer(request, answer)
+            total_ms = (time.perf_counter() - started_at) * 1000
+            request_metrics.record(f"{mode}.total_ms", total_ms)
+            logger.info(f"🎉 Processing completed in {total_ms:.0f} ms ({mode}) - response ready (audio job: {audio['audio_job_id'] or 'none'})")
+        
+            return GetMoreInformationResponse(
+                answer=answer,
+                confidence=conversation_summary.confidence,
+                sources=sources,
+                needs_clarification=False,
+                **audio
+            )
+        finally:
+            _cancel_speculative_search(speculative_search)
+
         
+    except (HTTPException, UnknownSessionError):
+        raise
+    except UpstreamUnavailableError as e:
+        logger.error(f"LLM unavailable in get_more_information: {e}")
+        raise _upstream_unavailable(e)
     except Exception as e:
         logger.error(f"Error in get_more_information: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _rag_events(request: GetMoreInformationRequest) -> AsyncIterator[Tuple[str, Dict]]:
+    """Streaming variant of the RAG flow: yields (event, data) - sources first, then tokens, done and audio (when ready)"""
+    started_at = time.perf_counter()
+    logger.info(f"🚀 Starting streaming request (session: {request.conversation.session_id})")
+    
+    rolling_summary, conversation_messages = _session_context(request)
+    speculative_search = _start_speculative_search(conversation_messages)
+    mode = "speculative" if speculative_search else "sequential"
+    # Also runs when the client disconnects and the generator is closed mid-stream
+    try:
+        with request_metrics.timer(f"{mode}.summarize_ms"):
+            conversation_summary = await _summarize(conversation_messages, rolling_summary)
+    
+        if conversation_summary.next_action.value == "ask_user":
+            _cancel_speculative_search(speculative_search)
+            answer = _clarification_answer(conversation_summary)
+            _remember_answer(request, answer)
+            yield "sources", {"sources": [], "confidence": conversation_summary.confidence, "needs_clarification": True}
+            yield "token", {"text": answer}
+            yield "done", {
+                "answer": answer,
+                "audio_url": None,
+                "confidence": conversation_summary.confidence,
+                "needs_clarification": True
+            }
+            return
+    
+        question = conversation_summary.rag_query
+        query_vector = await vector_store.embed_query(question)
+        collection_version = await vector_store.get_collection_version()
+        cached = semantic_cache.lookup(query_vector, collection_version)
+        if cached:
+            _cancel_speculative_search(speculative_search)
+            _remember_answer(request, cached.answer)
+            audio = await _start_tldr_audio(cached.answer)
+            yield "sources", {"sources": cached.sources, "confidence": conversation_summary.confidence, "needs_clarification": False}
+            yield "token", {"text": cached.answer}
+            yield "done", {
+                "answer": cached.answer,
+                **audio,
+                "confidence": conversation_summary.confidence,
+                "needs_clarification": False,
+                "cached": True,
+                "ttft_ms": round((time.perf_counter() - started_at) * 1000, 1)
+            }
+            async for event in _audio_events(audio["audio_job_id"]):
+                yield event
+            return
+    
+        generation_started_at = time.perf_counter()
+        with request_metrics.timer(f"{mode}.retrieval_wait_ms"):
+            context_docs = await _retrieve(question, query_vector, speculative_search)
+        sources = _format_sources(context_docs)
+        yield "sources", {
+            "sources": sources,
+            "confidence": conversation_summary.confidence,
+            "needs_clarification": False
+        }
+    
+        answer_parts = []
+        ttft_ms = None
+        async for token in llm_service.stream_answer_with_context(question, context_docs):
+            if ttft_ms is None:
+                ttft_ms = round((time.perf_counter() - started_at) * 1000, 1)
+                request_metrics.record(f"{mode}.ttft_ms", ttft_ms)
+                logger.info(f"⚡ Time to first token: {ttft_ms} ms")
+            answer_parts.append(token)
+            yield "token", {"text": token}
+        answer = "".join(answer_parts)
+        _remember_answer(request, answer)
+    
+        audio = await _start_tldr_audio(answer)
+        _cache_answer(
+            question, query_vector, collection_version, answer,
+            context_docs, sources, conversation_summary.confidence, generation_started_at
+        )
+    
+        total_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        request_metrics.record(f"{mode}.stream_total_ms", total_ms)
+        logger.info(f"🎉 Streaming completed in {total_ms} ms (TTFT: {ttft_ms} ms)")
+        yield "done", {
+            "answer": answer,
+            **audio,
+            "confidence": conversation_summary.confidence,
+            "needs_clarification": False,
+            "cached": False,
+            "ttft_ms": ttft_ms,
+            "total_ms": total_ms
+        }
+        async for event in _audio_events(audio["audio_job_id"]):
+            yield event
+    finally:
+        _cancel_speculative_search(speculative_search)
+
+
+async def _audio_events(audio_job_id: Optional[str]) -> AsyncIterator[Tuple[str, Dict]]:
+    """Yields a single "audio" event once the TLDR audio job finishes (or times out)"""
+    job = audio_jobs.get(audio_job_id) if audio_job_id else None
+    if job is None:
+        return
+    await audio_jobs.wait(job, Config.AUDIO_JOB_TIMEOUT)
+    yield "audio", job.to_response().model_dump(mode="json")
+
+def _sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/get_more_information/stream")
+async def get_more_information_stream(request: GetMoreInformationRequest):
+    """Streams the bot answer as Server-Sent Events (sources, token..., audio, done)"""
+    _require_session(request)
+    
+    async def event_stream():
+        try:
+            async for event, data in _rag_events(request):
+                yield _sse_event(event, data)
+        except UnknownSessionError as e:
+            yield _sse_event("error", {"detail": str(e), "resync": True})
+        except UpstreamUnavailableError as e:
+            logger.error(f"LLM unavailable in get_more_information_stream: {e}")
+            yield _sse_event("error", {"detail": _upstream_unavailable(e).detail, "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error in get_more_information_stream: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/get_more_information")
+async def get_more_information_ws(websocket: WebSocket):
+    """Streams bot answers over a WebSocket - one GetMoreInformationRequest JSON per message"""
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                request = GetMoreInformationRequest.model_validate(payload)
+                async for event, data in _rag_events(request):
+                    await websocket.send_json({"event": event, "data": data})
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"event": "error", "data": {"detail": str(e)}})
+            except WebSocketDisconnect:
+                raise
+            except UnknownSessionError as e:
+                await websocket.send_json({"event": "error", "data": {"detail": str(e), "resync": True}})
+            except UpstreamUnavailableError as e:
+                logger.error(f"LLM unavailable in get_more_information_ws: {e}")
+                await websocket.send_json({"event": "error", "data": {"detail": _upstream_unavailable(e).detail, "retry_after": e.retry_after}})
+            except Exception as e:
+                logger.error(f"Error in get_more_information_ws: {e}")
+                await websocket.send_json({"event": "error", "data": {"detail": str(e)}})
+    except WebSocketDisconnect:
+        logger.info("🔌 WebSocket client disconnected")
+
 @app.post("/summarize-conversation", response_model=ConversationSummaryResponse)
 async def summarize_conversation(request: ConversationSummaryRequest):
     """Endpoint for testing conversation summary"""
@@ -234,56 +620,112 @@ async def summarize_conversation(request: ConversationSummaryRequest):
             message="Conversation summary generated successfully"
         )
         
+    except UpstreamUnavailableError as e:
+        logger.error(f"LLM unavailable during conversation summarization: {e}")
+        raise _upstream_unavailable(e)
     except Exception as e:
         logger.error(f"Error during conversation summarization: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload_documents", response_model=DocumentUploadResponse)
+async def _stream_upload_to_file(file: UploadFile, destination: str, too_large_detail: str) -> Tuple[int, str]:
+    """Streams an upload to disk in chunks, enforcing MAX_FILE_SIZE and hashing on the fly"""
+    max_bytes = Config.MAX_FILE_SIZE * 1024 * 1024
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(destination, "wb") as output:
+            while chunk := await file.read(Config.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                # Stop as soon as the limit is exceeded instead of reading the whole upload
+                if size > max_bytes:
+                    raise HTTPException(status_code=400, detail=too_large_detail)
+                digest.update(chunk)
+                output.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.unlink(destination)
+        raise
+    return size, digest.hexdigest()
+
+async def _ingest_file(file_path: str, source: str, file_hash: str, progress: Optional[Callable[[str, int], None]] = None) -> Dict:
+    """Indexes a file, replacing only the chunks that changed since the last ingestion"""
+    if vector_store.manifests.is_unchanged(source, file_hash):
+        logger.info(f"⏭️ File {source} unchanged since last ingestion - skipping")
+        return {"added": 0, "deleted": 0, "unchanged": 0, "chunks": 0, "skipped_file": True}
+    
+    # Extraction, embedding and upserts run as concurrent stages
+    return await ingestion_pipeline.ingest_source(
+        source,
+        document_processor.iter_documents(file_path, source),
+        file_hash,
+        progress
+    )
+
+ingestion_jobs = IngestionJobManager(
+    ingest_file=_ingest_file,
+    db_path=Config.INGESTION_JOBS_DB,
+    staging_dir=Config.INGESTION_STAGING_DIR,
+    workers=Config.INGESTION_WORKERS
+)
+
+@app.post("/upload_documents", response_model=DocumentUploadResponse, status_code=202)
 async def upload_documents(files: List[UploadFile] = File(...)):
-    """Endpoint for uploading documents"""
+    """Accepts documents and queues them for background ingestion"""
+    job_id = uuid.uuid4().hex
     try:
-        total_documents = 0
-        
-        for file in files:
-            # Check file size
-            if file.size > Config.MAX_FILE_SIZE * 1024 * 1024:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"File {file.filename} is too large. Maximum size: {Config.MAX_FILE_SIZE}MB"
-                )
+        job_files = []
+        
+        for index, file in enumerate(files):
+            too_large_detail = f"File {file.filename} is too large. Maximum size: {Config.MAX_FILE_SIZE}MB"
             
-            # Save file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_file_path = temp_file.name
+            # Check declared file size before reading anything
+            if file.size is not None and file.size > Config.MAX_FILE_SIZE * 1024 * 1024:
+                raise HTTPException(status_code=400, detail=too_large_detail)
             
-            try:
-                # Process document
-                documents = await document_processor.process_file(temp_file_path, file.filename)
-                
-                if documents:
-                    # Add to vector store
-                    added_count = await vector_store.add_documents(documents)
-                    total_documents += added_count
-                    logger.info(f"Added {added_count} fragments from file {file.filename}")
-                
-            finally:
-                # Delete temporary file
-                os.unlink(temp_file_path)
+            # Stream file to the job staging area (hashed on the fly); extraction reads it from there
+            staged_path = ingestion_jobs.staging_path(job_id, index, file.filename)
+            staged_path.parent.mkdir(parents=True, exist_ok=True)
+            _, file_hash = await _stream_upload_to_file(file, str(staged_path), too_large_detail)
+            job_files.append(IngestionFileProgress(filename=file.filename, file_hash=file_hash))
+        
+        job = IngestionJob(
+            job_id=job_id,
+            created_at=datetime.now(),
+            files_total=len(job_files),
+            files=job_files
+        )
+        await ingestion_jobs.submit(job)
+        logger.info(f"📥 Queued ingestion job {job_id} with {len(job_files)} files")
         
         return DocumentUploadResponse(
             success=True,
-            message=f"Successfully added {total_documents} document fragments",
-            document_count=total_documents
+            message=f"Accepted {len(job_files)} files for ingestion (job {job_id})",
+            document_count=0,
+            job_id=job_id
         )
         
     except HTTPException:
+        shutil.rmtree(ingestion_jobs.staging_dir / job_id, ignore_errors=True)
         raise
     except Exception as e:
+        shutil.rmtree(ingestion_jobs.staging_dir / job_id, ignore_errors=True)
         logger.error(f"Error uploading documents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ingestion/jobs", response_model=IngestionJobListResponse, tags=["Ingestion"])
+async def list_ingestion_jobs(limit: int = 50):
+    """Returns recent ingestion jobs with their progress"""
+    jobs = await ingestion_jobs.list(limit)
+    return IngestionJobListResponse(jobs=jobs, total_count=len(jobs))
+
+@app.get("/ingestion/jobs/{job_id}", response_model=IngestionJob, tags=["Ingestion"])
+async def get_ingestion_job(job_id: str):
+    """Returns progress of a single ingestion job"""
+    job = await ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    return job
+
 @app.get("/documents/info")
 async def get_documents_info():
     """Returns information about documents in database"""
@@ -298,6 +740,26 @@ async def get_documents_info():
 
 
 
+@app.get("/metrics", tags=["Metrics"])
+async def get_metrics():
+    """Returns cache and performance counters"""
+    return {
+        "embedding_cache": vector_store.embedding_cache.get_stats(),
+        "audio": audio_service.get_stats(),
+        "audio_jobs": audio_jobs.get_stats(),
+        "semantic_cache": semantic_cache.get_stats(),
+        "intent_classifier": intent_classifier.get_stats(),
+        "sessions": session_store.get_stats(),
+        "context_packing": llm_service.context_packer.get_stats(),
+        "llm": llm_service.get_stats(),
+        "llm_resilience": llm_service.resilience.get_stats(),
+        "single_flight": {
+            "llm": llm_service.single_flight.get_stats(),
+            "embedding": vector_store.single_flight.get_stats()
+        },
+        "requests": request_metrics.get_stats()
+    }
+
 @app.post("/generate-audio")
 async def generate_audio(request: Dict):
     """Generates audio from text"""
@@ -312,18 +774,111 @@ async def generate_audio(request: Dict):
         logger.error(f"Error generating audio: {e}")
         raise HTTPException(status_code=500, detail="Error generating audio")
 
+@app.get("/audio/jobs/{job_id}", response_model=AudioJobResponse)
+async def get_audio_job(job_id: str):
+    """Returns the status of a background TLDR audio job"""
+    job = audio_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Audio job {job_id} not found")
+    return job.to_response()
+
+@app.get("/audio/jobs/{job_id}/events")
+async def get_audio_job_events(job_id: str):
+    """Server-Sent Events: a single "audio" event when the job is ready or failed (keep-alive comments meanwhile)"""
+    job = audio_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Audio job {job_id} not found")
+    
+    async def event_stream():
+        deadline = time.monotonic() + Config.AUDIO_JOB_TIMEOUT
+        while not await audio_jobs.wait(job, min(15.0, max(0.0, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline:
+                break
+            yield ": keep-alive\n\n"
+        yield _sse_event("audio", job.to_response().model_dump(mode="json"))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _iter_file(path: str, start: int, length: int, chunk_size: int = 65536):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def _audio_file_response(request: Request, path: str, filename: str) -> Response:
+    """Serves a finished audio file with Range, ETag and immutable Cache-Control.
+    
+    File names are content hashes, so a file never changes and browsers can cache it for good.
+    """
+    size = os.path.getsize(path)
+    etag = f'"{Path(filename).stem}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except RangeNotSatisfiableError:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=audio_service.media_type(filename), headers=headers)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(path, start, end - start + 1),
+        status_code=206,
+        media_type=audio_service.media_type(filename),
+        headers=headers
+    )
+
 @app.get("/audio/{filename}")
-async def get_audio_file(filename: str):
-    """Retrieves audio file"""
+async def get_audio_file(filename: str, request: Request):
+    """Retrieves an audio file - streamed while it is still being generated, with Range/ETag support once finished"""
     try:
-        import os
-        from fastapi.responses import FileResponse
-        
-        audio_path = os.path.join("static/audio", filename)
-        if os.path.exists(audio_path):
-            return FileResponse(audio_path, media_type="audio/mpeg")
-        else:
+        if Path(filename).name != filename or filename.startswith("."):
             raise HTTPException(status_code=404, detail="Audio file not found")
+        
+        # A job submitted a moment ago may not have started writing yet
+        job = audio_jobs.get(Path(filename).stem.removeprefix("speech_"))
+        for _ in range(20):
+            if job is None or job.done.is_set() or audio_service.in_progress(filename) is not None:
+                break
+            await asyncio.sleep(0.05)
+        
+        # Still being generated - chunked transfer of what has been written so far, then the rest as it arrives
+        progress = audio_service.in_progress(filename)
+        if progress is not None:
+            return StreamingResponse(
+                progress.iter_bytes(),
+                media_type=audio_service.media_type(filename),
+                headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+            )
+        
+        audio_path = audio_service.store.path(filename)
+        if os.path.isfile(audio_path):
+            return _audio_file_response(request, audio_path, filename)
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving audio file: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving audio file")
@@ -359,32 +914,17 @@ async def chat_with_json(json_data: Dict):
         ]
         
         # Use LLMService to generate response
-        response = await llm_service.answer_with_context("", [{"content": json_text}])
+        # The whole JSON is one document, not retrieval results - nothing to rank or pack
+        response = await llm_service.answer_with_context("", [{"content": json_text}], pack=False)
         
-        # Generate audio only for TLDR (optional)
-        audio_url = None
-        if Config.ELEVENLABS_API_KEY:
-            logger.info("🎵 Generating audio for TLDR from JSON...")
-            
-            # Extract TLDR from response
-            tldr_text = ""
-            if "**TLDR:**" in response:
-                tldr_part = response.split("**Description:**")[0]
-                tldr_text = tldr_part.replace("**TLDR:**", "").strip()
-                logger.info(f"📋 TLDR for audio: '{tldr_text[:50]}...'")
-            else:
-                # If no TLDR format, use entire response
-                tldr_text = response
-                logger.info(f"📋 Using entire response for audio: '{tldr_text[:50]}...'")
-            
-            audio_url = await audio_service.generate_speech(tldr_text)
-            if audio_url:
-                logger.info(f"✅ Audio generated for TLDR: {audio_url}")
-            else:
-                logger.warning("⚠️ Failed to generate audio")
+        # Audio only for TLDR (optional) - generated in the background
+        audio = await _start_tldr_audio(response)
         
-        return {"answer": response, "audio_url": audio_url}
+        return {"answer": response, **audio}
         
+    except UpstreamUnavailableError as e:
+        logger.error(f"LLM unavailable while processing JSON: {e}")
+        raise _upstream_unavailable(e)
     except Exception as e:
         logger.error(f"Error processing JSON: {e}")
         raise HTTPException(status_code=500, detail="Error processing JSON")
@@ -402,18 +942,11 @@ async def upload_file(file: UploadFile = File(...)):
     try:
         logger.info(f"📤 Rozpoczynam wrzucanie pliku: {file.filename}")
         
-        # Sprawdź rozmiar pliku
-        file_size = 0
-        content = await file.read()
-        file_size = len(content)
+        too_large_detail = f"Plik jest za duży. Maksymalny rozmiar: {Config.MAX_FILE_SIZE}MB"
         
-        logger.info(f"📏 Rozmiar pliku: {file_size} bajtów")
-        
-        if file_size > Config.MAX_FILE_SIZE * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Plik jest za duży. Maksymalny rozmiar: {Config.MAX_FILE_SIZE}MB"
-            )
+        # Sprawdź deklarowany rozmiar pliku przed odczytem
+        if file.size is not None and file.size > Config.MAX_FILE_SIZE * 1024 * 1024:
+            raise HTTPException(status_code=400, detail=too_large_detail)
         
         # Sprawdź rozszerzenie
         file_extension = Path(file.filename).suffix.lower()
@@ -427,12 +960,13 @@ async def upload_file(file: UploadFile = File(...)):
         upload_dir = Path(Config.UPLOAD_DIR)
         upload_dir.mkdir(exist_ok=True)
         
-        # Zapisz plik
+        # Zapisz plik strumieniowo do pliku tymczasowego i podmień atomowo
         file_path = upload_dir / file.filename
-        with open(file_path, "wb") as f:
-            f.write(content)
+        partial_path = upload_dir / f".{file.filename}.part"
+        file_size, _ = await _stream_upload_to_file(file, str(partial_path), too_large_detail)
+        os.replace(partial_path, file_path)
         
-        logger.info(f"💾 Plik zapisany: {file_path}")
+        logger.info(f"💾 Plik zapisany: {file_path} ({file_size} bajtów)")
         
         # Przygotuj informacje o pliku
         file_info = FileInfo(
@@ -519,6 +1053,43 @@ async def list_files():
         logger.error(f"Błąd podczas listowania plików: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/files/{filename}/ingest", response_model=DocumentUploadResponse, tags=["Files"])
+async def ingest_file(filename: str):
+    """
+    Indeksuje (ponownie) plik z katalogu uploads.
+    
+    Dodawane są tylko zmienione fragmenty, a nieaktualne punkty są usuwane.
+    
+    - **filename**: Nazwa pliku do zaindeksowania
+    """
+    try:
+        file_path = Path(Config.UPLOAD_DIR) / filename
+        
+        if not file_path.exists():
+            raise HTTPException(
+                status_code=404,
+                detail=f"Plik {filename} nie istnieje"
+            )
+        
+        result = await _ingest_file(str(file_path), filename, file_sha256(str(file_path)))
+        
+        if result["skipped_file"]:
+            message = f"Plik {filename} nie zmienił się od ostatniej indeksacji"
+        else:
+            message = f"Dodano {result['added']} fragmentów, usunięto {result['deleted']} nieaktualnych"
+        
+        return DocumentUploadResponse(
+            success=True,
+            message=message,
+            document_count=result["added"]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Błąd podczas indeksowania pliku: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/files/{filename}", tags=["Files"])
 async def delete_file(filename: str):
     """
@@ -529,13 +1100,18 @@ async def delete_file(filename: str):
     try:
         file_path = Path(Config.UPLOAD_DIR) / filename
         
-        if not file_path.exists():
+        # Pliki z /upload_documents nie trafiają do UPLOAD_DIR - wystarczy, że mają manifest
+        if not file_path.exists() and vector_store.manifests.load(filename) is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Plik {filename} nie istnieje"
             )
         
-        file_path.unlink()
+        # Najpierw wektory z Qdrant (jedno usunięcie filtrem po metadata.source), potem manifest i plik -
+        # jeśli Qdrant zawiedzie, plik zostaje i usunięcie można ponowić
+        await vector_store.delete_source(filename)
+        file_path.unlink(missing_ok=True)
+        
         return {"success": True, "message": f"Plik {filename} został usunięty"}
         
     except HTTPException:
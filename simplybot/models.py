@@ -11,6 +11,8 @@ class ConversationMessage(BaseModel):
 class Conversation(BaseModel):
     messages: List[ConversationMessage]
     session_id: Optional[str] = None
+    # True - messages zawiera tylko nowe wiadomości od poprzedniego requestu (wymaga session_id)
+    is_delta: bool = False
 
 class GetMoreInformationRequest(BaseModel):
     conversation: Conversation
@@ -21,11 +23,16 @@ class GetMoreInformationResponse(BaseModel):
     confidence: float = 0.0
     sources: List[Dict[str, Any]] = []
     needs_clarification: bool = False
+    cached: bool = False
+    # Audio TLDR generowane w tle - status pod /audio/jobs/{audio_job_id}
+    audio_job_id: Optional[str] = None
+    audio_stream_url: Optional[str] = None
 
 class DocumentUploadResponse(BaseModel):
     success: bool
     message: str
     document_count: int = 0
+    job_id: Optional[str] = None
 
 class HealthCheckResponse(BaseModel):
     status: str
@@ -85,4 +92,56 @@ class ConversationSummaryResponse(BaseModel):
     """Response z podsumowaniem rozmowy"""
     summary: ConversationSummary
     success: bool = True
-    message: Optional[str] = None 
\ No newline at end of file
+    message: Optional[str] = None
+
+class IngestionJobStatus(str, Enum):
+    """Status zadania indeksowania dokumentów"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class IngestionFileProgress(BaseModel):
+    """Postęp indeksowania pojedynczego pliku"""
+    filename: str
+    file_hash: str
+    status: IngestionJobStatus = IngestionJobStatus.QUEUED
+    chunks: int = 0
+    added: int = 0
+    deleted: int = 0
+    error: Optional[str] = None
+
+class IngestionJob(BaseModel):
+    """Zadanie indeksowania uruchamiane w tle"""
+    job_id: str
+    status: IngestionJobStatus = IngestionJobStatus.QUEUED
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    files_total: int = 0
+    files_done: int = 0
+    chunks_total: int = 0
+    embeddings_done: int = 0
+    points_upserted: int = 0
+    chunks_per_s: float = 0.0
+    errors: List[str] = []
+    files: List[IngestionFileProgress] = []
+
+class IngestionJobListResponse(BaseModel):
+    jobs: List[IngestionJob]
+    total_count: int
+
+class AudioJobStatus(str, Enum):
+    """Status generowania audio TLDR w tle"""
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+class AudioJobResponse(BaseModel):
+    job_id: str
+    status: AudioJobStatus
+    audio_url: Optional[str] = None
+    # Dostępny od razu - w trakcie generowania zwraca audio progresywnie
+    stream_url: Optional[str] = None
+    error: Optional[str] = None
+    elapsed_ms: Optional[float] = None
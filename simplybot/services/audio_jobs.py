@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set
+import asyncio
+import logging
+import time
+from simplybot.models import AudioJobResponse, AudioJobStatus
+from simplybot.services.audio_service import AudioService
+from simplybot.services.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AudioJob:
+    """Generowanie audio dla jednego tekstu (ID = klucz treści, więc ten sam tekst to to samo zadanie)"""
+    job_id: str
+    status: AudioJobStatus
+    stream_url: str
+    audio_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_response(self) -> AudioJobResponse:
+        return AudioJobResponse(
+            job_id=self.job_id,
+            status=self.status,
+            audio_url=self.audio_url,
+            stream_url=self.stream_url,
+            error=self.error,
+            elapsed_ms=round((self.finished_at - self.created_at) * 1000, 1) if self.finished_at else None
+        )
+
+class AudioJobManager:
+    """Generuje audio w tle, żeby odpowiedź tekstowa nie czekała na TTS.
+
+    Gotowe pliki z cache dają zadanie od razu w stanie ready. Zadania są
+    trzymane w pamięci (LRU) - zakończone mogą zostać usunięte po max_jobs.
+    """
+
+    def __init__(self, audio_service: AudioService, max_jobs: int = 1000):
+        self.audio_service = audio_service
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, AudioJob]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._render_latency = LatencyTracker()
+        self._stats = {"submitted": 0, "ready_from_cache": 0, "deduplicated": 0, "stale": 0, "rendered": 0, "failed": 0}
+
+    async def submit(self, text: str) -> AudioJob:
+        """Zwraca zadanie dla tekstu - istniejące, gotowe z cache albo nowe, generowane w tle"""
+        self._stats["submitted"] += 1
+        job_id = self.audio_service.content_key(text)
+        job = self._jobs.get(job_id)
+        if job is not None and job.status == AudioJobStatus.PENDING:
+            self._jobs.move_to_end(job_id)
+            self._stats["deduplicated"] += 1
+            return job
+
+        # Gotowe zadanie jest aktualne tylko, dopóki jego plik jest w cache (limit rozmiaru może go usunąć)
+        audio_url = await self.audio_service.cached_url(text)
+        if job is not None and job.status == AudioJobStatus.READY:
+            if audio_url:
+                self._jobs.move_to_end(job_id)
+                self._stats["deduplicated"] += 1
+                return job
+            self._stats["stale"] += 1
+
+        stream_url = self.audio_service.url_for(self.audio_service.filename_for(text))
+        if audio_url:
+            job = AudioJob(job_id=job_id, status=AudioJobStatus.READY, stream_url=stream_url, audio_url=audio_url)
+            job.finished_at = job.created_at
+            job.done.set()
+            self._stats["ready_from_cache"] += 1
+        else:
+            job = AudioJob(job_id=job_id, status=AudioJobStatus.PENDING, stream_url=stream_url)
+            task = asyncio.create_task(self._render(job, text))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        self._evict()
+        return job
+
+    async def _render(self, job: AudioJob, text: str):
+        try:
+            job.audio_url = await self.audio_service.render(text)
+            job.status = AudioJobStatus.READY
+            self._stats["rendered"] += 1
+        except Exception as e:
+            logger.error(f"Error generating audio for job {job.job_id}: {e}")
+            job.status = AudioJobStatus.FAILED
+            job.error = str(e)
+            self._stats["failed"] += 1
+        finally:
+            job.finished_at = time.perf_counter()
+            self._render_latency.record((job.finished_at - job.created_at) * 1000)
+            job.done.set()
+
+    def _evict(self):
+        """Usuwa najstarsze zakończone zadania ponad max_jobs (trwające zostają)"""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done.is_set()][:excess]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[AudioJob]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: AudioJob, timeout: float) -> bool:
+        """Czeka na zakończenie zadania - False, jeśli minął timeout"""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending": sum(1 for job in self._jobs.values() if not job.done.is_set()),
+            "render_ms": self._render_latency.summary()
+        }
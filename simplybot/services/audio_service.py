@@ -1,76 +1,399 @@
-from elevenlabs import generate, save, set_api_key
+from elevenlabs import generate, set_api_key
 from simplybot.config import Config
+from simplybot.services.audio_store import AudioStore
+from simplybot.services.metrics import LatencyTracker
+from simplybot.services.single_flight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, Any, Iterator, List, Optional
+import asyncio
+import hashlib
+import io
 import logging
+import math
 import os
-from datetime import datetime
+import re
+import struct
+import time
+import wave
 
 logger = logging.getLogger(__name__)
 
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+def split_sentences(text: str, min_chars: int = 40) -> List[str]:
+    """Dzieli tekst na zdania; zdania krótsze niż min_chars są łączone z sąsiednim"""
+    segments: List[str] = []
+    for sentence in filter(None, (part.strip() for part in SENTENCE_END.split(text.strip()))):
+        if segments and len(segments[-1]) < min_chars:
+            segments[-1] = f"{segments[-1]} {sentence}"
+        else:
+            segments.append(sentence)
+    if len(segments) > 1 and len(segments[-1]) < min_chars:
+        last = segments.pop()
+        segments[-1] = f"{segments[-1]} {last}"
+    return segments
+
+class ElevenLabsBackend:
+    """Synteza mowy przez API ElevenLabs (blokujące wywołanie HTTP)"""
+    name = "elevenlabs"
+    extension = "mp3"
+    
+    def __init__(self, api_key: Optional[str], voice_id: str, model: str):
+        if api_key:
+            set_api_key(api_key)
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.model = model
+    
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+    
+    def synthesize_stream(self, text: str) -> Iterator[bytes]:
+        """Zwraca fragmenty MP3 w miarę generowania"""
+        return generate(text=text, voice=self.voice_id, model=self.model, stream=True)
+    
+    def stitch(self, index: int, audio: bytes) -> bytes:
+        """Ramki MP3 kolejnych segmentów można sklejać bezpośrednio"""
+        return audio
+    
+    def finalize_stitched(self, f: BinaryIO):
+        pass
+
+class LocalToneBackend:
+    """Lokalny zastępnik TTS do testów i benchmarków bez sieci.
+    
+    Zwraca WAV z tonem o długości proporcjonalnej do tekstu; latency symuluje
+    czas do pierwszego fragmentu u prawdziwego dostawcy (blokujący sleep, jak wywołanie HTTP).
+    """
+    name = "local"
+    extension = "wav"
+    sample_rate = 16000
+    
+    def __init__(self, voice_id: str, latency: float = 0.0, chars_per_second: float = 15.0):
+        self.voice_id = voice_id
+        self.model = "tone"
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+    
+    @property
+    def available(self) -> bool:
+        return True
+    
+    def synthesize_stream(self, text: str, chunk_size: int = 16384) -> Iterator[bytes]:
+        if self.latency:
+            time.sleep(self.latency)
+        audio = self._render_wav(text)
+        for start in range(0, len(audio), chunk_size):
+            yield audio[start:start + chunk_size]
+    
+    def _wav_header(self, data_size: int) -> bytes:
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1,
+            self.sample_rate, self.sample_rate * 2, 2, 16, b"data", data_size
+        )
+    
+    def stitch(self, index: int, audio: bytes) -> bytes:
+        """Pierwszy segment dostaje nagłówek WAV o nieznanej długości (jak przy streamingu), kolejne tylko próbki"""
+        with wave.open(io.BytesIO(audio), "rb") as wav:
+            frames = wav.readframes(wav.getnframes())
+        return frames if index else self._wav_header(0xFFFFFFFF - 36) + frames
+    
+    def finalize_stitched(self, f: BinaryIO):
+        """Wpisuje do nagłówka rzeczywistą długość danych"""
+        data_size = f.tell() - 44
+        f.seek(0)
+        f.write(self._wav_header(data_size))
+        f.seek(0, os.SEEK_END)
+    
+    def _render_wav(self, text: str) -> bytes:
+        frames = int(self.sample_rate * max(0.2, len(text) / self.chars_per_second))
+        samples = (int(8000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(frames))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(b"".join(struct.pack("<h", sample) for sample in samples))
+        return buffer.getvalue()
+
+class ProgressiveAudio:
+    """Plik audio w trakcie generowania - czytelnicy dostają kolejne fragmenty, zanim TTS skończy"""
+    
+    def __init__(self, part_path: str, final_path: str):
+        self.part_path = part_path
+        self.final_path = final_path
+        self.finished = False
+        self._changed = asyncio.Event()
+    
+    def notify(self):
+        """Budzi czytelników (wywoływane w event loopie po każdym zapisanym fragmencie)"""
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    def finish(self):
+        self.finished = True
+        self.notify()
+    
+    def _open(self):
+        # Po zakończeniu plik .part jest przemianowany na docelowy
+        for path in (self.part_path, self.final_path):
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                continue
+        return None
+    
+    async def iter_bytes(self, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        """Zwraca zapisane dotąd bajty, potem czeka na kolejne, aż generowanie się zakończy"""
+        f = None
+        try:
+            while True:
+                changed = self._changed
+                finished = self.finished
+                if f is None:
+                    f = self._open()
+                    if f is None:
+                        if finished:
+                            return
+                        await changed.wait()
+                        continue
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if chunk:
+                    yield chunk
+                elif finished:
+                    return
+                else:
+                    await changed.wait()
+        finally:
+            if f is not None:
+                f.close()
+
 class AudioService:
     def __init__(self):
-        if Config.ELEVENLABS_API_KEY:
-            set_api_key(Config.ELEVENLABS_API_KEY)
         self.voice_id = Config.ELEVENLABS_VOICE_ID
+        self.backend = self._initialize_backend()
         self.audio_dir = "static/audio"
         self._ensure_audio_dir()
+        self.store = AudioStore(
+            self.audio_dir,
+            db_path=Config.AUDIO_INDEX_DB,
+            max_bytes=Config.AUDIO_CACHE_MAX_BYTES,
+            sweep_interval=Config.AUDIO_CACHE_SWEEP_INTERVAL
+        )
+        
+        # Blokujące wywołania TTS działają w osobnej puli wątków, nie w event loopie
+        self._executor = ThreadPoolExecutor(max_workers=max(1, Config.TTS_WORKERS), thread_name_prefix="tts")
+        self.single_flight = SingleFlight("tts")
+        self._tts_latency = LatencyTracker()
+        self._first_chunk_latency = LatencyTracker()
+        self._segment_latency = LatencyTracker()
+        # Dłuższe teksty są dzielone na zdania renderowane równolegle i cache'owane osobno
+        self.sentence_pipeline = Config.TTS_SENTENCE_PIPELINE
+        self.segment_min_chars = Config.TTS_SEGMENT_MIN_CHARS
+        # Pliki w trakcie generowania - serwowane progresywnie przez /audio/{filename}
+        self._in_progress: Dict[str, ProgressiveAudio] = {}
+        self._stats = {"requests": 0, "generated": 0, "errors": 0, "segmented": 0, "segments": 0, "segments_generated": 0, "segment_hits": 0}
+    
+    def _initialize_backend(self):
+        """Wybiera backend TTS (TTS_BACKEND)"""
+        if Config.TTS_BACKEND == "elevenlabs":
+            return ElevenLabsBackend(Config.ELEVENLABS_API_KEY, self.voice_id, Config.ELEVENLABS_MODEL)
+        if Config.TTS_BACKEND == "local":
+            return LocalToneBackend(self.voice_id, latency=Config.TTS_LOCAL_LATENCY)
+        raise ValueError(f"Nieobsługiwany backend TTS: {Config.TTS_BACKEND}")
+    
+    @property
+    def enabled(self) -> bool:
+        return self.backend.available
     
     def _ensure_audio_dir(self):
         """Upewnia się, że katalog audio istnieje"""
         os.makedirs(self.audio_dir, exist_ok=True)
     
+    def content_key(self, text: str) -> str:
+        """Klucz adresowany treścią: hash(backend, głos, model, tekst)"""
+        key = "\n".join([self.backend.name, self.backend.voice_id, self.backend.model, text])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    
+    def filename_for(self, text: str) -> str:
+        return f"speech_{self.content_key(text)}.{self.backend.extension}"
+    
+    @staticmethod
+    def url_for(filename: str) -> str:
+        return f"/audio/{filename}"
+    
+    @staticmethod
+    def media_type(filename: str) -> str:
+        return "audio/wav" if filename.endswith(".wav") else "audio/mpeg"
+    
+    def in_progress(self, filename: str) -> Optional[ProgressiveAudio]:
+        return self._in_progress.get(filename)
+    
+    def _synthesize_to_file(self, text: str, progress: ProgressiveAudio, loop: asyncio.AbstractEventLoop):
+        """Zapisuje fragmenty audio do pliku .part w miarę generowania (w puli wątków), na końcu zmienia nazwę"""
+        started_at = time.perf_counter()
+        first_chunk = True
+        try:
+            with open(progress.part_path, "wb") as f:
+                for chunk in self.backend.synthesize_stream(text):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    f.flush()
+                    if first_chunk:
+                        self._first_chunk_latency.record((time.perf_counter() - started_at) * 1000)
+                        first_chunk = False
+                    loop.call_soon_threadsafe(progress.notify)
+            os.replace(progress.part_path, progress.final_path)
+        except BaseException:
+            if os.path.exists(progress.part_path):
+                os.remove(progress.part_path)
+            raise
+        self._tts_latency.record((time.perf_counter() - started_at) * 1000)
+        self._stats["generated"] += 1
+    
+    def _synthesize_segment(self, segment: str, path: str) -> bytes:
+        """Generuje audio jednego zdania i zapisuje je w cache (w puli wątków)"""
+        started_at = time.perf_counter()
+        audio = b"".join(self.backend.synthesize_stream(segment))
+        part_path = f"{path}.{os.getpid()}.part"
+        with open(part_path, "wb") as f:
+            f.write(audio)
+        os.replace(part_path, path)
+        self._segment_latency.record((time.perf_counter() - started_at) * 1000)
+        self._stats["segments_generated"] += 1
+        return audio
+    
+    async def _segment_audio(self, loop: asyncio.AbstractEventLoop, segment: str) -> bytes:
+        """Audio jednego zdania - z cache (powtarzające się frazy) albo z TTS"""
+        filename = f"segment_{self.content_key(segment)}.{self.backend.extension}"
+        path = self.store.path(filename)
+        if await self.store.lookup(filename):
+            try:
+                audio = await asyncio.to_thread(Path(path).read_bytes)
+                self._stats["segment_hits"] += 1
+                return audio
+            except FileNotFoundError:
+                pass  # usunięty przez limit rozmiaru w międzyczasie
+        
+        async def synthesize() -> bytes:
+            audio = await loop.run_in_executor(self._executor, self._synthesize_segment, segment, path)
+            await self.store.record(filename)
+            return audio
+        
+        return await self.single_flight.do(filename, synthesize)
+    
+    def _append_segment(self, f: BinaryIO, index: int, audio: bytes):
+        f.write(self.backend.stitch(index, audio))
+        f.flush()
+    
+    async def _synthesize_segments(self, loop: asyncio.AbstractEventLoop, segments: List[str], progress: ProgressiveAudio):
+        """Renderuje zdania równolegle (pula TTS) i dopisuje je do pliku po kolei, gdy tylko kolejne jest gotowe"""
+        started_at = time.perf_counter()
+        tasks = [asyncio.ensure_future(self._segment_audio(loop, segment)) for segment in segments]
+        try:
+            with open(progress.part_path, "wb") as f:
+                for index, task in enumerate(tasks):
+                    await asyncio.to_thread(self._append_segment, f, index, await task)
+                    if index == 0:
+                        self._first_chunk_latency.record((time.perf_counter() - started_at) * 1000)
+                    progress.notify()
+                await asyncio.to_thread(self.backend.finalize_stitched, f)
+            os.replace(progress.part_path, progress.final_path)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            if os.path.exists(progress.part_path):
+                os.remove(progress.part_path)
+            raise
+        self._tts_latency.record((time.perf_counter() - started_at) * 1000)
+        self._stats["generated"] += 1
+        self._stats["segmented"] += 1
+        self._stats["segments"] += len(segments)
+    
+    async def _synthesize_and_record(self, loop: asyncio.AbstractEventLoop, text: str, filename: str):
+        final_path = self.store.path(filename)
+        progress = ProgressiveAudio(f"{final_path}.{os.getpid()}.part", final_path)
+        self._in_progress[filename] = progress
+        try:
+            segments = split_sentences(text, self.segment_min_chars) if self.sentence_pipeline else [text]
+            if len(segments) > 1:
+                logger.info(f"✂️ Dzielę tekst na {len(segments)} zdań - renderowanie równoległe")
+                await self._synthesize_segments(loop, segments, progress)
+            else:
+                await loop.run_in_executor(self._executor, self._synthesize_to_file, text, progress, loop)
+            await self.store.record(filename)
+        finally:
+            progress.finish()
+            del self._in_progress[filename]
+    
+    async def cached_url(self, text: str) -> Optional[str]:
+        """Zwraca URL istniejącego pliku audio dla tekstu (bez wywołania TTS) albo None"""
+        self._stats["requests"] += 1
+        filename = self.filename_for(text)
+        if await self.store.lookup(filename):
+            audio_url = self.url_for(filename)
+            logger.info(f"⚡ Audio z cache: {audio_url}")
+            return audio_url
+        return None
+    
+    async def render(self, text: str) -> str:
+        """Generuje audio (błędy są zgłaszane wyjątkiem) i zwraca jego URL"""
+        filename = self.filename_for(text)
+        
+        # Logowanie rozpoczęcia generowania audio
+        text_preview = text[:10] + "..." if len(text) > 10 else text
+        logger.info(f"🎵 Rozpoczynam generowanie audio dla tekstu: '{text_preview}' (długość: {len(text)} znaków, backend: {self.backend.name})")
+        logger.info(f"📁 Zapisuję audio do: {self.store.path(filename)}")
+        
+        # Równoczesne żądania tego samego tekstu czekają na jedną syntezę
+        loop = asyncio.get_running_loop()
+        try:
+            await self.single_flight.do(
+                filename,
+                lambda: self._synthesize_and_record(loop, text, filename)
+            )
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        
+        audio_url = self.url_for(filename)
+        logger.info(f"✅ Audio wygenerowane pomyślnie: {audio_url}")
+        return audio_url
+    
     async def generate_speech(self, text: str) -> str:
-        """Generuje audio z tekstu używając ElevenLabs"""
+        """Generuje audio z tekstu (albo zwraca istniejący plik dla tego samego tekstu i głosu)"""
         try:
-            if not Config.ELEVENLABS_API_KEY:
+            if not self.enabled:
                 logger.warning("Brak klucza API ElevenLabs - pomijam generowanie audio")
                 return None
             
-            # Logowanie rozpoczęcia generowania audio
-            text_preview = text[:10] + "..." if len(text) > 10 else text
-            logger.info(f"🎵 Rozpoczynam generowanie audio dla tekstu: '{text_preview}' (długość: {len(text)} znaków)")
-            
-            # Generuj unikalną nazwę pliku
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"speech_{timestamp}.mp3"
-            filepath = os.path.join(self.audio_dir, filename)
-            
-            logger.info(f"📁 Zapisuję audio do: {filepath}")
-            
-            # Generuj audio
-            audio = generate(
-                text=text,
-                voice=self.voice_id,
-                model="eleven_multilingual_v2"
-            )
-            
-            # Zapisz plik
-            save(audio, filepath)
-            
-            # Zwróć URL do pliku
-            audio_url = f"/static/audio/{filename}"
-            logger.info(f"✅ Audio wygenerowane pomyślnie: {audio_url}")
-            
-            return audio_url
-            
+            return await self.cached_url(text) or await self.render(text)
+        
         except Exception as e:
             logger.error(f"Błąd podczas generowania audio: {e}")
             return None
     
-    async def cleanup_old_audio_files(self, max_age_hours: int = 24):
-        """Usuwa stare pliki audio"""
-        try:
-            import time
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
-            
-            for filename in os.listdir(self.audio_dir):
-                if filename.endswith('.mp3'):
-                    filepath = os.path.join(self.audio_dir, filename)
-                    file_age = current_time - os.path.getmtime(filepath)
-                    
-                    if file_age > max_age_seconds:
-                        os.remove(filepath)
-                        logger.info(f"Usunięto stary plik audio: {filename}")
-                        
-        except Exception as e:
-            logger.error(f"Błąd podczas czyszczenia plików audio: {e}") 
\ No newline at end of file
+    def get_stats(self) -> Dict[str, Any]:
+        """Zwraca statystyki cache audio i czasu syntezy"""
+        return {
+            **self._stats,
+            "backend": self.backend.name,
+            "tts_ms": self._tts_latency.summary(),
+            "tts_first_chunk_ms": self._first_chunk_latency.summary(),
+            "segment_ms": self._segment_latency.summary(),
+            "coalesced": self.single_flight.get_stats()["coalesced"],
+            "store": self.store.get_stats()
+        }
+    
+    async def start(self):
+        """Indeksuje pliki audio i uruchamia egzekwowanie limitu rozmiaru"""
+        await self.store.start()
+    
+    async def stop(self):
+        """Zatrzymuje zadanie w tle i pulę wątków TTS"""
+        await self.store.stop()
+        self._executor.shutdown(wait=False)
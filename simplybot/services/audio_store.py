@@ -0,0 +1,212 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+# Pojedynczy zakres "start-end", "start-" lub "-sufiks" (RFC 7233)
+BYTE_RANGE_RE = re.compile(r"([0-9]*)-([0-9]*)")
+
+class RangeNotSatisfiableError(Exception):
+    """Zakres nie obejmuje żadnego bajtu pliku (odpowiedź 416)"""
+
+def parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parsuje nagłówek Range z pojedynczym zakresem bajtów wg RFC 7233.
+
+    Zwraca (pierwszy, ostatni) bajt albo None, gdy nagłówek trzeba zignorować
+    (inna jednostka, wiele zakresów, niepoprawna składnia) i wysłać cały plik.
+    """
+    unit, _, spec = range_header.partition("=")
+    match = BYTE_RANGE_RE.fullmatch(spec.strip())
+    if unit.strip().lower() != "bytes" or match is None or match.group() == "-":
+        return None
+    start, end = match.groups()
+    if not start:
+        # Sufiks: ostatnie N bajtów - "-0" i pusty plik nie mają czego zwrócić
+        length = int(end)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiableError(range_header)
+        return max(0, size - length), size - 1
+    first = int(start)
+    if end and int(end) < first:
+        # Ostatni bajt przed pierwszym - zakres niepoprawny składniowo, ignorowany
+        return None
+    if first >= size:
+        raise RangeNotSatisfiableError(range_header)
+    return first, min(int(end), size - 1) if end else size - 1
+
+class AudioStore:
+    """Indeks plików audio (rozmiar, ostatni dostęp) w SQLite z limitem łącznego rozmiaru.
+
+    Nazwy plików są adresowane treścią, więc istnienie pliku oznacza trafienie
+    w cache. Zadanie w tle usuwa najdawniej używane pliki, gdy katalog
+    przekroczy max_bytes.
+    """
+
+    def __init__(self, audio_dir: str, db_path: str, max_bytes: int = 500 * 1024 * 1024, sweep_interval: float = 60.0):
+        self.audio_dir = audio_dir
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._usage = {"files": 0, "disk_bytes": 0}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+        self._init_db()
+
+    def _init_db(self):
+        """Tworzy tabelę indeksu w SQLite"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS audio_files ("
+                "filename TEXT PRIMARY KEY, size INTEGER NOT NULL, created_at REAL NOT NULL, "
+                "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_audio_files_last_access ON audio_files (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Otwiera połączenie SQLite, zatwierdza zmiany i je zamyka"""
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.audio_dir, filename)
+
+    def _sync_directory(self):
+        """Dopisuje do indeksu pliki spoza niego (np. sprzed wdrożenia) i usuwa wpisy bez plików"""
+        # Porzucone pliki .part po przerwanym generowaniu (świeże mogą należeć do innego workera)
+        stale_before = time.time() - 3600
+        for entry in os.scandir(self.audio_dir):
+            if entry.is_file() and entry.name.endswith(".part") and entry.stat().st_mtime < stale_before:
+                os.remove(entry.path)
+        on_disk = {
+            entry.name: entry.stat()
+            for entry in os.scandir(self.audio_dir)
+            if entry.is_file() and entry.name.endswith(AUDIO_EXTENSIONS)
+        }
+        with self._connect() as connection:
+            indexed = {row[0] for row in connection.execute("SELECT filename FROM audio_files")}
+            connection.executemany(
+                "INSERT INTO audio_files (filename, size, created_at, last_access) VALUES (?, ?, ?, ?)",
+                [(name, stat.st_size, stat.st_mtime, stat.st_mtime) for name, stat in on_disk.items() if name not in indexed]
+            )
+            connection.executemany("DELETE FROM audio_files WHERE filename = ?", [(name,) for name in indexed - set(on_disk)])
+        self._refresh_usage()
+
+    def _refresh_usage(self):
+        with self._connect() as connection:
+            files, disk_bytes = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio_files").fetchone()
+        with self._lock:
+            self._usage = {"files": files, "disk_bytes": disk_bytes}
+
+    def _touch(self, filename: str) -> bool:
+        if not os.path.exists(self.path(filename)):
+            with self._connect() as connection:
+                connection.execute("DELETE FROM audio_files WHERE filename = ?", (filename,))
+            return False
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE audio_files SET last_access = ?, hits = hits + 1 WHERE filename = ?",
+                (time.time(), filename)
+            )
+        return True
+
+    def _record(self, filename: str):
+        size = os.path.getsize(self.path(filename))
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO audio_files (filename, size, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (filename, size, now, now)
+            )
+        with self._lock:
+            self._usage["files"] += 1
+            self._usage["disk_bytes"] += size
+
+    def _evict(self) -> List[str]:
+        """Usuwa najdawniej używane pliki, aż łączny rozmiar zmieści się w limicie"""
+        self._refresh_usage()
+        if self._usage["disk_bytes"] <= self.max_bytes:
+            return []
+        with self._connect() as connection:
+            rows = connection.execute("SELECT filename, size FROM audio_files ORDER BY last_access").fetchall()
+        total = self._usage["disk_bytes"]
+        evicted = []
+        for filename, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted.append(filename)
+            self._stats["evictions"] += 1
+            self._stats["evicted_bytes"] += size
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM audio_files WHERE filename = ?", [(name,) for name in evicted])
+        self._refresh_usage()
+        return evicted
+
+    async def lookup(self, filename: str) -> bool:
+        """Sprawdza, czy plik jest w cache, i odświeża jego ostatni dostęp"""
+        hit = await asyncio.to_thread(self._touch, filename)
+        self._stats["hits" if hit else "misses"] += 1
+        return hit
+
+    async def record(self, filename: str):
+        """Dodaje nowo zapisany plik do indeksu"""
+        await asyncio.to_thread(self._record, filename)
+
+    async def enforce_limit(self) -> int:
+        evicted = await asyncio.to_thread(self._evict)
+        if evicted:
+            logger.info(f"🧹 Audio cache over {self.max_bytes} bytes - evicted {len(evicted)} least recently used files")
+        return len(evicted)
+
+    async def start(self):
+        """Indeksuje istniejące pliki i uruchamia okresowe egzekwowanie limitu"""
+        await asyncio.to_thread(self._sync_directory)
+        await self.enforce_limit()
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.enforce_limit()
+            except Exception as e:
+                logger.error(f"Error enforcing audio cache limit: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            usage = dict(self._usage)
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **usage,
+            "max_bytes": self.max_bytes,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+        }
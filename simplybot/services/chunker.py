@@ -0,0 +1,190 @@
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+import logging
+import re
+from simplybot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Akapity rozdziela pusta linia
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n")
+# Zdanie kończy się znakiem interpunkcyjnym (zachowanym w tekście) lub końcem akapitu
+SENTENCE_RE = re.compile(r"\S.*?(?:[.!?…]+[\"')\]]*(?=\s|$)|$)", re.S)
+# Nagłówki: markdown, numeracja rozdziałów ("2.1 Konfiguracja") lub krótka linia wielkimi literami
+HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S.*"
+    r"|(?:\d+\.)*\d+\.?\s+[A-ZĄĆĘŁŃÓŚŹŻ][^.!?]{0,80}"
+    r"|[A-ZĄĆĘŁŃÓŚŹŻ0-9][A-ZĄĆĘŁŃÓŚŹŻ0-9 \-:/&]{2,80})$"
+)
+TOKEN_APPROX_RE = re.compile(r"\w+|[^\w\s]")
+# Długie słowa (URL, base64, identyfikatory) tokenizery dzielą na kilka tokenów
+APPROX_CHARS_PER_TOKEN = 8
+
+def _approximate_token_count(text: str) -> int:
+    """Przybliżona liczba tokenów (słowa i znaki interpunkcyjne, długie słowa liczone po znakach)"""
+    return sum(-(-len(token) // APPROX_CHARS_PER_TOKEN) for token in TOKEN_APPROX_RE.findall(text))
+
+@lru_cache(maxsize=None)
+def get_token_counter(embedding_model: Optional[str] = None) -> Callable[[str], int]:
+    """Zwraca funkcję liczącą tokeny tokenizerem modelu embeddings"""
+    embedding_model = embedding_model or Config.EMBEDDING_MODEL
+    try:
+        if embedding_model == "bge":
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(Config.BGE_MODEL_NAME)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(Config.OPENAI_EMBEDDING_MODEL)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"⚠️ Tokenizer for {embedding_model} unavailable, using approximate token count: {e}")
+        return _approximate_token_count
+
+@lru_cache(maxsize=None)
+def get_prompt_token_counter(model: Optional[str] = None) -> Callable[[str], int]:
+    """Zwraca funkcję liczącą tokeny tokenizerem modelu LLM (do budżetu promptu)"""
+    model = model or Config.ANSWER_MODEL or (Config.OPENROUTER_MODEL if Config.OPENROUTER_API_KEY else Config.OPENAI_MODEL)
+    try:
+        import tiktoken
+        try:
+            # Modele OpenRouter mają prefiks dostawcy, np. "openai/gpt-4o"
+            encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"⚠️ Tokenizer for {model} unavailable, using approximate token count: {e}")
+        return _approximate_token_count
+
+class TextChunker:
+    """Dzieli tekst na fragmenty o budżecie tokenów, z nakładaniem i granicami struktury"""
+
+    def __init__(
+        self,
+        max_tokens: int = 256,
+        overlap_tokens: int = 32,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        min_fill: float = 0.5
+    ):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.count_tokens = count_tokens or _approximate_token_count
+        # Na granicy akapitu fragment jest zamykany, jeśli wypełnia co najmniej min_fill budżetu
+        self.min_fill = min_fill
+
+    @staticmethod
+    def is_heading(line: str) -> bool:
+        """Sprawdza czy linia wygląda na nagłówek"""
+        return len(line) <= 100 and bool(HEADING_RE.match(line))
+
+    def split(self, text: str) -> List[str]:
+        """Dzieli tekst na fragmenty w jednym przebiegu"""
+        chunks: List[str] = []
+        units: List[Tuple[str, int]] = []  # (zdanie, liczba tokenów) w bieżącym fragmencie
+        current_tokens = 0
+
+        def emit(keep_overlap: bool):
+            nonlocal units, current_tokens
+            if not units:
+                return
+            chunks.append(" ".join(unit for unit, _ in units))
+            if not keep_overlap or not self.overlap_tokens:
+                units, current_tokens = [], 0
+                return
+            # Ostatnie zdania (do overlap_tokens) przechodzą do następnego fragmentu
+            carried: List[Tuple[str, int]] = []
+            carried_tokens = 0
+            for unit, tokens in reversed(units):
+                if carried_tokens + tokens > self.overlap_tokens:
+                    break
+                carried.append((unit, tokens))
+                carried_tokens += tokens
+            carried.reverse()
+            units, current_tokens = carried, carried_tokens
+
+        def add(unit: str, tokens: int):
+            nonlocal current_tokens
+            if units and current_tokens + tokens > self.max_tokens:
+                emit(keep_overlap=True)
+                # Nakładka nie może przepełnić fragmentu razem z nowym zdaniem
+                while units and current_tokens + tokens > self.max_tokens:
+                    current_tokens -= units.pop(0)[1]
+            units.append((unit, tokens))
+            current_tokens += tokens
+
+        def add_block(block: str):
+            for match in SENTENCE_RE.finditer(block):
+                sentence = " ".join(match.group().split())
+                if not sentence:
+                    continue
+                tokens = self.count_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    add(sentence, tokens)
+                else:
+                    for piece, piece_tokens in self._split_long_sentence(sentence):
+                        add(piece, piece_tokens)
+
+        for paragraph in PARAGRAPH_RE.split(text.replace("\r\n", "\n")):
+            block_lines: List[str] = []
+            for line in paragraph.split("\n"):
+                line = line.strip()
+                if not line:
+                    continue
+                if self.is_heading(line):
+                    # Nagłówek zawsze otwiera nowy fragment
+                    add_block(" ".join(block_lines))
+                    block_lines = []
+                    emit(keep_overlap=False)
+                    add(line, self.count_tokens(line))
+                else:
+                    block_lines.append(line)
+            add_block(" ".join(block_lines))
+
+            if current_tokens >= self.max_tokens * self.min_fill:
+                emit(keep_overlap=False)
+
+        emit(keep_overlap=False)
+        return chunks
+
+    def _split_long_sentence(self, sentence: str) -> List[Tuple[str, int]]:
+        """Dzieli zdanie dłuższe niż budżet na kawałki po słowach"""
+        pieces: List[Tuple[str, int]] = []
+        words: List[str] = []
+        tokens = 0
+        for word in sentence.split(" "):
+            word_tokens = self.count_tokens(word)
+            if word_tokens > self.max_tokens:
+                # Słowo ponad budżet (URL, base64, identyfikator) - cięte po znakach
+                if words:
+                    pieces.append((" ".join(words), tokens))
+                    words, tokens = [], 0
+                pieces.extend(self._split_long_word(word))
+                continue
+            if words and tokens + word_tokens > self.max_tokens:
+                pieces.append((" ".join(words), tokens))
+                words, tokens = [], 0
+            words.append(word)
+            tokens += word_tokens
+        if words:
+            pieces.append((" ".join(words), tokens))
+        return pieces
+
+    def _split_long_word(self, word: str) -> List[Tuple[str, int]]:
+        """Dzieli słowo dłuższe niż budżet na najdłuższe prefiksy mieszczące się w budżecie"""
+        pieces: List[Tuple[str, int]] = []
+        while word:
+            # Wyszukiwanie binarne po długości prefiksu - co najmniej jeden znak, żeby zawsze był postęp
+            low, high = 1, len(word)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.count_tokens(word[:middle]) <= self.max_tokens:
+                    low = middle
+                else:
+                    high = middle - 1
+            pieces.append((word[:low], self.count_tokens(word[:low])))
+            word = word[low:]
+        return pieces
@@ -0,0 +1,160 @@
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import logging
+import re
+from simplybot.services.chunker import get_prompt_token_counter
+from simplybot.services.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+
+class ContextPacker:
+    """Dopasowuje fragmenty kontekstu do budżetu tokenów promptu.
+
+    Fragmenty są brane od najwyższego score, prawie-duplikaty są pomijane,
+    a sąsiednie fragmenty tego samego źródła/strony są łączone bez powtórzonej
+    nakładki (chunker przenosi ostatnie zdania do kolejnego fragmentu).
+    Najlepszy fragment większy niż cały budżet jest przycinany, a nie pomijany.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        duplicate_threshold: float = 0.9
+    ):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or get_prompt_token_counter()
+        self.duplicate_threshold = duplicate_threshold
+        self._tokens_saved = LatencyTracker()
+        self._stats = {"requests": 0, "input_tokens": 0, "packed_tokens": 0, "dropped_duplicates": 0, "dropped_over_budget": 0, "truncated": 0, "merged": 0}
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+        words = WORD_RE.findall(text.lower())
+        if len(words) < size:
+            return {tuple(words)}
+        return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    @staticmethod
+    def _position(doc: Dict[str, Any]) -> Optional[Tuple[str, Any, int]]:
+        """(źródło, strona, numer fragmentu) - tylko dla punktów zapisanych z numerem fragmentu"""
+        metadata = doc.get("metadata", {})
+        if metadata.get("chunk") is None:
+            return None
+        return metadata.get("source"), metadata.get("page"), int(metadata["chunk"])
+
+    @staticmethod
+    def _merge_text(first: str, second: str) -> str:
+        """Łączy kolejne fragmenty, usuwając nakładkę (najdłuższy sufiks pierwszego będący prefiksem drugiego)"""
+        max_overlap = min(len(first), len(second))
+        for size in range(max_overlap, 0, -1):
+            if (
+                first.endswith(second[:size])
+                and (size == len(first) or first[-size - 1] == " ")
+                and (size == len(second) or second[size] == " ")
+            ):
+                return f"{first}{second[size:]}"
+        return f"{first} {second}"
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Najdłuższy prefiks (po słowach) mieszczący się w max_tokens"""
+        words = text.split(" ")
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(" ".join(words[:middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low])
+
+    def pack(self, context_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Zwraca fragmenty mieszczące się w budżecie, od najbardziej trafnych"""
+        if not context_docs:
+            return []
+
+        input_tokens = sum(self.count_tokens(doc.get("content", "")) for doc in context_docs)
+        selected: List[Dict[str, Any]] = []
+        selected_shingles: List[Set[Tuple[str, ...]]] = []
+        used_tokens = 0
+        dropped_duplicates = 0
+        dropped_over_budget = 0
+        truncated = 0
+
+        for doc in sorted(context_docs, key=lambda doc: doc.get("score", 0), reverse=True):
+            content = doc.get("content", "")
+            shingles = self._shingles(content)
+            if any(len(shingles & other) / len(shingles | other) >= self.duplicate_threshold for other in selected_shingles):
+                dropped_duplicates += 1
+                continue
+            tokens = self.count_tokens(content)
+            if used_tokens + tokens > self.max_tokens and not selected:
+                # Najlepszy fragment sam przekracza budżet - lepiej jego początek niż pusty kontekst
+                doc = {**doc, "content": self._truncate(content, self.max_tokens)}
+                tokens = self.count_tokens(doc["content"])
+                truncated += 1
+            elif used_tokens + tokens > self.max_tokens:
+                # Mniejszy fragment o niższym score może się jeszcze zmieścić
+                dropped_over_budget += 1
+                continue
+            selected.append(doc)
+            selected_shingles.append(shingles)
+            used_tokens += tokens
+
+        packed, merged = self._merge_adjacent(selected)
+        packed_tokens = sum(self.count_tokens(doc["content"]) for doc in packed)
+
+        self._stats["requests"] += 1
+        self._stats["input_tokens"] += input_tokens
+        self._stats["packed_tokens"] += packed_tokens
+        self._stats["dropped_duplicates"] += dropped_duplicates
+        self._stats["dropped_over_budget"] += dropped_over_budget
+        self._stats["truncated"] += truncated
+        self._stats["merged"] += merged
+        self._tokens_saved.record(input_tokens - packed_tokens)
+        logger.info(
+            f"📦 Context packed: {len(context_docs)} -> {len(packed)} fragments, {input_tokens} -> {packed_tokens} tokens "
+            f"(duplicates: {dropped_duplicates}, over budget: {dropped_over_budget}, truncated: {truncated}, merged: {merged})"
+        )
+        return packed
+
+    def _merge_adjacent(self, docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """Łączy fragmenty o kolejnych numerach z tego samego źródła i strony"""
+        positioned = sorted(
+            (doc for doc in docs if self._position(doc)),
+            key=lambda doc: tuple(str(value) if i < 2 else value for i, value in enumerate(self._position(doc)))
+        )
+        groups: List[List[Dict[str, Any]]] = []
+        for doc in positioned:
+            source, page, chunk = self._position(doc)
+            if groups:
+                last_source, last_page, last_chunk = self._position(groups[-1][-1])
+                if (last_source, last_page) == (source, page) and chunk == last_chunk + 1:
+                    groups[-1].append(doc)
+                    continue
+            groups.append([doc])
+        groups.extend([doc] for doc in docs if not self._position(doc))
+
+        packed = []
+        merged = 0
+        for group in groups:
+            if len(group) == 1:
+                packed.append(group[0])
+                continue
+            content = group[0].get("content", "")
+            for doc in group[1:]:
+                content = self._merge_text(content, doc.get("content", ""))
+            merged += len(group) - 1
+            packed.append({**group[0], "content": content, "score": max(doc.get("score", 0) for doc in group)})
+        packed.sort(key=lambda doc: doc.get("score", 0), reverse=True)
+        return packed, merged
+
+    def get_stats(self) -> Dict[str, Any]:
+        tokens_saved = self._stats["input_tokens"] - self._stats["packed_tokens"]
+        return {
+            **self._stats,
+            "tokens_saved": tokens_saved,
+            "tokens_saved_per_request": self._tokens_saved.summary(),
+            "max_tokens": self.max_tokens
+        }
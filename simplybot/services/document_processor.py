@@ -1,150 +1,208 @@
 import os
+import asyncio
 import logging
-from typing import List, Dict, Any
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import List, Dict, Any, Tuple, AsyncIterator, Optional
 from datetime import datetime
 import PyPDF2
 from docx import Document
-import re
+from simplybot.config import Config
+from simplybot.services.chunker import TextChunker, get_token_counter
 
 logger = logging.getLogger(__name__)
 
+# Funkcje ekstrakcji i dzielenia na fragmenty uruchamiane w procesach roboczych (muszą być na poziomie modułu)
+
+_chunker = None
+
+def _get_chunker() -> TextChunker:
+    """Tworzy chunker (z tokenizerem modelu embeddings) raz na proces"""
+    global _chunker
+    if _chunker is None:
+        _chunker = TextChunker(
+            max_tokens=Config.CHUNK_MAX_TOKENS,
+            overlap_tokens=Config.CHUNK_OVERLAP_TOKENS,
+            count_tokens=get_token_counter()
+        )
+    return _chunker
+
+def _count_pdf_pages(file_path: str) -> int:
+    """Zwraca liczbę stron PDF"""
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _chunk_pdf_pages(file_path: str, start: int, end: int) -> List[Tuple[int, List[str]]]:
+    """Wyciąga tekst ze stron PDF z zakresu [start, end) i dzieli go na fragmenty (strona to granica fragmentu)"""
+    chunker = _get_chunker()
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [
+            (page_num, chunker.split(pdf_reader.pages[page_num].extract_text() or ""))
+            for page_num in range(start, end)
+        ]
+
+_docx_cache: Optional[Tuple[str, float, Any]] = None
+
+def _load_docx(file_path: str):
+    """Wczytuje DOCX raz na proces (kolejne zakresy akapitów tego samego pliku używają go ponownie)"""
+    global _docx_cache
+    mtime = os.path.getmtime(file_path)
+    if _docx_cache is None or _docx_cache[:2] != (file_path, mtime):
+        _docx_cache = (file_path, mtime, Document(file_path))
+    return _docx_cache[2]
+
+def _count_docx_paragraphs(file_path: str) -> int:
+    """Zwraca liczbę akapitów DOCX"""
+    return len(_load_docx(file_path).paragraphs)
+
+def _chunk_docx_paragraphs(file_path: str, start: int, end: int) -> List[str]:
+    """Dzieli na fragmenty akapity DOCX z zakresu [start, end)"""
+    paragraphs = _load_docx(file_path).paragraphs[start:end]
+    # Każdy akapit DOCX jest osobnym akapitem dla chunkera
+    return _get_chunker().split("\n\n".join(paragraph.text for paragraph in paragraphs))
+
+def _txt_blocks(file_path: str, block_bytes: int) -> List[Tuple[int, int]]:
+    """Dzieli plik TXT na bloki bajtów [start, end) o rozmiarze ~block_bytes, kończące się na granicy akapitu.
+    
+    Plik jest czytany linia po linii; bez pustych linii blok jest zamykany na końcu linii po 2 * block_bytes.
+    """
+    blocks = []
+    start = position = 0
+    with open(file_path, 'rb') as file:
+        for line in file:
+            position += len(line)
+            size = position - start
+            if (size >= block_bytes and not line.strip()) or size >= 2 * block_bytes:
+                blocks.append((start, position))
+                start = position
+    if position > start:
+        blocks.append((start, position))
+    return blocks
+
+def _chunk_txt_block(file_path: str, start: int, end: int) -> List[str]:
+    """Wczytuje blok pliku TXT i dzieli go na fragmenty"""
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        return _get_chunker().split(file.read(end - start).decode('utf-8'))
+
 class DocumentProcessor:
     def __init__(self):
         self.supported_extensions = ['.pdf', '.txt', '.docx']
+        self.max_workers = Config.EXTRACTION_WORKERS or os.cpu_count() or 1
+        self._executor = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Tworzy pulę procesów przy pierwszym użyciu.
+        
+        Serwer ma już kilka pul wątków, a fork procesu wielowątkowego może zakleszczyć
+        dziecko na odziedziczonych blokadach - dlatego forkserver (spawn, gdzie go brak).
+        """
+        if self._executor is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(start_method))
+            logger.info(f"⚙️ Pula procesów ekstrakcji: {self.max_workers} procesów")
+        return self._executor
+    
+    async def _run_in_process(self, func, *args):
+        """Uruchamia funkcję ekstrakcji w puli procesów"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+    
+    def shutdown(self):
+        """Zamyka pulę procesów"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
     
     async def process_file(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
         """Processes file and returns list of documents"""
+        documents = []
         try:
-            file_extension = os.path.splitext(filename)[1].lower()
-            
-            if file_extension not in self.supported_extensions:
-                raise ValueError(f"Unsupported file format: {file_extension}")
-            
-            if file_extension == '.pdf':
-                return await self._process_pdf(file_path, filename)
-            elif file_extension == '.txt':
-                return await self._process_txt(file_path, filename)
-            elif file_extension == '.docx':
-                return await self._process_docx(file_path, filename)
-                
+            async for batch in self.iter_documents(file_path, filename):
+                documents.extend(batch)
         except Exception as e:
             logger.error(f"Error processing file {filename}: {e}")
             return []
-    
-    async def _process_pdf(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
-        """Przetwarza plik PDF"""
-        documents = []
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
-                    if text.strip():
-                        # Podziel tekst na mniejsze fragmenty
-                        chunks = self._split_text(text, max_length=1000)
-                        
-                        for chunk_num, chunk in enumerate(chunks):
-                            doc = {
-                                "content": chunk,
-                                "source": filename,
-                                "title": f"{filename} - Strona {page_num + 1}",
-                                "content_type": "pdf",
-                                "page": page_num + 1,
-                                "chunk": chunk_num + 1,
-                                "added_at": datetime.now().isoformat()
-                            }
-                            documents.append(doc)
-                            
-        except Exception as e:
-            logger.error(f"Błąd podczas przetwarzania PDF {filename}: {e}")
-        
         return documents
     
-    async def _process_txt(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
-        """Przetwarza plik TXT"""
-        documents = []
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-                
-                if text.strip():
-                    # Podziel tekst na mniejsze fragmenty
-                    chunks = self._split_text(text, max_length=1000)
-                    
-                    for chunk_num, chunk in enumerate(chunks):
-                        doc = {
-                            "content": chunk,
-                            "source": filename,
-                            "title": filename,
-                            "content_type": "txt",
-                            "chunk": chunk_num + 1,
-                            "added_at": datetime.now().isoformat()
-                        }
-                        documents.append(doc)
-                        
-        except Exception as e:
-            logger.error(f"Błąd podczas przetwarzania TXT {filename}: {e}")
+    async def iter_documents(self, file_path: str, filename: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Zwraca dokumenty paczkami w miarę ekstrakcji (PDF - zakres stron, TXT - blok bajtów, DOCX - zakres akapitów)"""
+        file_extension = os.path.splitext(filename)[1].lower()
         
-        return documents
+        if file_extension not in self.supported_extensions:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        if file_extension == '.pdf':
+            async for batch in self._iter_pdf(file_path, filename):
+                yield batch
+        elif file_extension == '.txt':
+            blocks = await self._run_in_process(_txt_blocks, file_path, max(1, Config.TXT_BLOCK_BYTES))
+            logger.info(f"📄 TXT {filename}: {len(blocks)} bloków")
+            async for batch in self._iter_chunk_batches(_chunk_txt_block, file_path, blocks, filename, "txt"):
+                yield batch
+        elif file_extension == '.docx':
+            paragraph_count = await self._run_in_process(_count_docx_paragraphs, file_path)
+            shard_size = max(1, Config.DOCX_PARAGRAPHS_PER_SHARD)
+            shards = [(start, min(start + shard_size, paragraph_count)) for start in range(0, paragraph_count, shard_size)]
+            logger.info(f"📄 DOCX {filename}: {paragraph_count} akapitów, {len(shards)} zakresów")
+            async for batch in self._iter_chunk_batches(_chunk_docx_paragraphs, file_path, shards, filename, "docx"):
+                yield batch
     
-    async def _process_docx(self, file_path: str, filename: str) -> List[Dict[str, Any]]:
-        """Przetwarza plik DOCX"""
-        documents = []
+    async def _iter_shards(self, func, file_path: str, shards: List[Tuple[int, int]]) -> AsyncIterator[Any]:
+        """Uruchamia func(file_path, start, end) dla zakresów równolegle, zwracając wyniki w kolejności zakresów"""
+        shards = deque(shards)
+        # W toku jest najwyżej max_workers zakresów - pamięć nie rośnie z rozmiarem pliku
+        in_flight = deque()
         try:
-            doc = Document(file_path)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            
-            if text.strip():
-                # Podziel tekst na mniejsze fragmenty
-                chunks = self._split_text(text, max_length=1000)
-                
-                for chunk_num, chunk in enumerate(chunks):
-                    doc_item = {
-                        "content": chunk,
-                        "source": filename,
-                        "title": filename,
-                        "content_type": "docx",
-                        "chunk": chunk_num + 1,
-                        "added_at": datetime.now().isoformat()
-                    }
-                    documents.append(doc_item)
-                    
-        except Exception as e:
-            logger.error(f"Błąd podczas przetwarzania DOCX {filename}: {e}")
-        
-        return documents
+            while shards or in_flight:
+                while shards and len(in_flight) < self.max_workers:
+                    start, end = shards.popleft()
+                    in_flight.append(asyncio.ensure_future(self._run_in_process(func, file_path, start, end)))
+                yield await in_flight.popleft()
+        finally:
+            for future in in_flight:
+                future.cancel()
     
-    def _split_text(self, text: str, max_length: int = 1000) -> List[str]:
-        """Dzieli tekst na mniejsze fragmenty"""
-        # Usuń nadmiarowe białe znaki
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        if len(text) <= max_length:
-            return [text]
-        
-        chunks = []
-        current_chunk = ""
-        
-        # Podziel na zdania
-        sentences = re.split(r'[.!?]+', text)
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk) + len(sentence) + 1 <= max_length:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
+    async def _iter_chunk_batches(
+        self, func, file_path: str, shards: List[Tuple[int, int]], filename: str, content_type: str
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Zwraca fragmenty kolejnych zakresów (TXT, DOCX) jako paczki z ciągłą numeracją"""
+        chunk_num = 0
+        async for chunks in self._iter_shards(func, file_path, shards):
+            batch = []
+            for chunk in chunks:
+                batch.append(self._make_document(chunk, filename, filename, content_type, chunk_num))
+                chunk_num += 1
+            yield batch
+    
+    async def _iter_pdf(self, file_path: str, filename: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Przetwarza PDF zakresami stron równolegle, zwracając wyniki w kolejności stron"""
+        page_count = await self._run_in_process(_count_pdf_pages, file_path)
+        shard_size = max(1, Config.PDF_PAGES_PER_SHARD)
+        shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+        logger.info(f"📄 PDF {filename}: {page_count} stron, {len(shards)} zakresów")
         
-        return chunks 
\ No newline at end of file
+        async for pages in self._iter_shards(_chunk_pdf_pages, file_path, shards):
+            batch = []
+            for page_num, chunks in pages:
+                for chunk_num, chunk in enumerate(chunks):
+                    batch.append(self._make_document(
+                        chunk, filename, f"{filename} - Strona {page_num + 1}", "pdf", chunk_num, page=page_num + 1
+                    ))
+            yield batch
+    
+    @staticmethod
+    def _make_document(chunk: str, filename: str, title: str, content_type: str, chunk_num: int, page: Optional[int] = None) -> Dict[str, Any]:
+        doc = {
+            "content": chunk,
+            "source": filename,
+            "title": title,
+            "content_type": content_type,
+            "chunk": chunk_num + 1,
+            "added_at": datetime.now().isoformat()
+        }
+        if page is not None:
+            doc["page"] = page
+        return doc
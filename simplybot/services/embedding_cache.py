@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Dwupoziomowy cache embeddingów: LRU w pamięci + trwały SQLite na dysku.
+
+    Warstwa dyskowa jest czyszczona przy zapisie (nie częściej niż co
+    prune_interval sekund): usuwane są wygasłe wpisy i najstarsze ponad max_disk_rows.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl_seconds: int = 86400,
+        db_path: Optional[str] = None,
+        max_disk_rows: int = 200000,
+        prune_interval: float = 300.0
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_rows = max_disk_rows
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+
+        self._memory: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "pruned": 0}
+
+        if self.db_path:
+            self._init_db()
+
+    def _init_db(self):
+        """Tworzy tabelę cache w SQLite"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            # WAL pozwala wielu workerom uvicorn czytać równolegle z zapisem
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON embeddings (created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Otwiera połączenie SQLite, zatwierdza zmiany i je zamyka"""
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def make_key(backend: str, model: str, text: str) -> str:
+        """Buduje klucz z (backend, model, tekst ze znormalizowanymi białymi znakami) - wielkość liter zmienia embedding"""
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{backend}\n{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, vector = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return vector
+
+    def _put_memory(self, key: str, vector: List[float], created_at: float):
+        with self._lock:
+            self._memory[key] = (created_at, vector)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _get_disk(self, key: str) -> Optional[Tuple[float, List[float]]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            return None
+        return created_at, np.frombuffer(blob, dtype=np.float32).tolist()
+
+    def _put_disk(self, key: str, vector: List[float], created_at: float):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, np.asarray(vector, dtype=np.float32).tobytes(), created_at)
+            )
+
+    def _prune_disk(self) -> int:
+        """Usuwa wygasłe wpisy i najstarsze ponad max_disk_rows - zwraca liczbę usuniętych"""
+        with self._connect() as connection:
+            deleted = connection.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_disk_rows:
+                deleted += connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                    (count - self.max_disk_rows,)
+                ).rowcount
+        return deleted
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        """Zwraca embedding z pamięci lub z dysku (bez blokowania event loopa)"""
+        vector = self._get_memory(key)
+        if vector is not None:
+            self._stats["memory_hits"] += 1
+            return vector
+
+        if self.db_path:
+            try:
+                entry = await asyncio.to_thread(self._get_disk, key)
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache disk read failed: {e}")
+                entry = None
+            if entry is not None:
+                created_at, vector = entry
+                self._put_memory(key, vector, created_at)
+                self._stats["disk_hits"] += 1
+                return vector
+
+        self._stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, vector: List[float]):
+        """Zapisuje embedding w obu warstwach cache"""
+        created_at = time.time()
+        self._put_memory(key, vector, created_at)
+        self._stats["writes"] += 1
+
+        if self.db_path:
+            try:
+                await asyncio.to_thread(self._put_disk, key, vector, created_at)
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding cache disk write failed: {e}")
+            await self._maybe_prune(created_at)
+
+    async def _maybe_prune(self, now: float):
+        if now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        try:
+            pruned = await asyncio.to_thread(self._prune_disk)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache disk prune failed: {e}")
+            return
+        if pruned:
+            self._stats["pruned"] += pruned
+            logger.info(f"🧹 Embedding cache: pruned {pruned} expired or excess disk entries")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Zwraca liczniki trafień i chybień"""
+        lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": bool(self.db_path)
+        }
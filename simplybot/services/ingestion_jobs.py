@@ -0,0 +1,199 @@
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+from simplybot.models import IngestionJob, IngestionJobStatus
+import asyncio
+import logging
+import shutil
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# (ścieżka pliku, źródło, hash pliku, callback postępu) -> wynik indeksowania
+IngestFileCallable = Callable[[str, str, str, Callable[[str, int], None]], Awaitable[Dict]]
+
+class IngestionJobStore:
+    """Trwały (SQLite) magazyn zadań indeksowania - przeżywa restart aplikacji"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Otwiera połączenie SQLite, zatwierdza zmiany i je zamyka"""
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def save(self, job: IngestionJob):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO ingestion_jobs (job_id, status, created_at, data) VALUES (?, ?, ?, ?)",
+                (job.job_id, job.status.value, job.created_at.isoformat(), job.model_dump_json())
+            )
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT data FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return IngestionJob.model_validate_json(row[0]) if row else None
+
+    def list(self, limit: int = 50) -> List[IngestionJob]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT data FROM ingestion_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [IngestionJob.model_validate_json(row[0]) for row in rows]
+
+    def incomplete(self) -> List[IngestionJob]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT data FROM ingestion_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (IngestionJobStatus.QUEUED.value, IngestionJobStatus.RUNNING.value)
+            ).fetchall()
+        return [IngestionJob.model_validate_json(row[0]) for row in rows]
+
+class IngestionJobManager:
+    """Kolejka zadań indeksowania obsługiwana przez ograniczoną pulę workerów"""
+
+    def __init__(self, ingest_file: IngestFileCallable, db_path: str, staging_dir: str, workers: int = 2):
+        self.ingest_file = ingest_file
+        self.store = IngestionJobStore(db_path)
+        self.staging_dir = Path(staging_dir)
+        self.workers = max(1, workers)
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        # Zadania w toku trzymane w pamięci - postęp jest zapisywany do SQLite z ograniczoną częstotliwością
+        self._active: Dict[str, IngestionJob] = {}
+
+    def staging_path(self, job_id: str, index: int, filename: str) -> Path:
+        """Ścieżka, pod którą plik czeka na przetworzenie"""
+        return self.staging_dir / job_id / f"{index}{Path(filename).suffix.lower()}"
+
+    async def start(self):
+        """Wznawia niedokończone zadania i uruchamia workery"""
+        for job in await asyncio.to_thread(self.store.incomplete):
+            missing = [
+                file.filename for index, file in enumerate(job.files)
+                if not self._is_finished(file.status) and not self.staging_path(job.job_id, index, file.filename).exists()
+            ]
+            if missing:
+                job.status = IngestionJobStatus.FAILED
+                job.errors.append(f"Staged files missing after restart: {', '.join(missing)}")
+                job.finished_at = datetime.now()
+                await asyncio.to_thread(self.store.save, job)
+                continue
+            logger.info(f"🔁 Resuming ingestion job {job.job_id}")
+            job.status = IngestionJobStatus.QUEUED
+            await self.submit(job)
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        """Zatrzymuje workery (niedokończone zadania zostaną wznowione po restarcie)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: IngestionJob):
+        """Zapisuje zadanie i dodaje je do kolejki"""
+        self._active[job.job_id] = job
+        await asyncio.to_thread(self.store.save, job)
+        await self._queue.put(job.job_id)
+
+    async def get(self, job_id: str) -> Optional[IngestionJob]:
+        if job_id in self._active:
+            return self._active[job_id]
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def list(self, limit: int = 50) -> List[IngestionJob]:
+        jobs = await asyncio.to_thread(self.store.list, limit)
+        # Zadania w toku mają świeższy postęp w pamięci
+        return [self._active.get(job.job_id, job) for job in jobs]
+
+    @staticmethod
+    def _is_finished(status: IngestionJobStatus) -> bool:
+        return status in (IngestionJobStatus.COMPLETED, IngestionJobStatus.FAILED)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(self._active[job_id])
+            except Exception as e:
+                logger.error(f"Ingestion worker {worker_id} failed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: IngestionJob):
+        job.status = IngestionJobStatus.RUNNING
+        job.started_at = job.started_at or datetime.now()
+        await asyncio.to_thread(self.store.save, job)
+        started_at = time.perf_counter()
+        last_saved_at = time.monotonic()
+        pending_save: Optional[asyncio.Task] = None
+
+        def progress(event: str, count: int):
+            nonlocal last_saved_at, pending_save
+            if event == "chunks":
+                job.chunks_total += count
+            elif event == "embedded":
+                job.embeddings_done += count
+            elif event == "upserted":
+                job.points_upserted += count
+            elapsed = time.perf_counter() - started_at
+            job.chunks_per_s = round(job.points_upserted / elapsed, 2) if elapsed > 0 else 0.0
+            if time.monotonic() - last_saved_at > 1.0 and (pending_save is None or pending_save.done()):
+                last_saved_at = time.monotonic()
+                # Callback działa w pętli zdarzeń - zapis migawki zadania idzie do wątku
+                pending_save = asyncio.create_task(asyncio.to_thread(self.store.save, job.model_copy(deep=True)))
+
+        async def save_job():
+            # Zaległy zapis postępu nie może nadpisać nowszego stanu zadania
+            if pending_save is not None:
+                await asyncio.gather(pending_save, return_exceptions=True)
+            await asyncio.to_thread(self.store.save, job)
+
+        logger.info(f"📥 Ingestion job {job.job_id}: {job.files_total} files")
+        for index, file in enumerate(job.files):
+            if self._is_finished(file.status):
+                continue
+            file.status = IngestionJobStatus.RUNNING
+            try:
+                result = await self.ingest_file(
+                    str(self.staging_path(job.job_id, index, file.filename)),
+                    file.filename,
+                    file.file_hash,
+                    progress
+                )
+                file.chunks = result.get("chunks", 0)
+                file.added = result["added"]
+                file.deleted = result["deleted"]
+                file.status = IngestionJobStatus.COMPLETED
+            except Exception as e:
+                logger.error(f"Error ingesting {file.filename} in job {job.job_id}: {e}")
+                file.status = IngestionJobStatus.FAILED
+                file.error = str(e)
+                job.errors.append(f"{file.filename}: {e}")
+            job.files_done += 1
+            await save_job()
+
+        failed = all(file.status == IngestionJobStatus.FAILED for file in job.files)
+        job.status = IngestionJobStatus.FAILED if failed and job.files else IngestionJobStatus.COMPLETED
+        job.finished_at = datetime.now()
+        await save_job()
+        self._active.pop(job.job_id, None)
+        shutil.rmtree(self.staging_dir / job.job_id, ignore_errors=True)
+        logger.info(f"✅ Ingestion job {job.job_id} {job.status.value}: {job.points_upserted} points, {job.chunks_per_s} chunks/s")
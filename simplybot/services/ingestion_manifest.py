@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Liczy hash SHA-256 pliku czytając go w kawałkach"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ManifestStore:
+    """Manifesty plików: hash pliku oraz mapowanie hash fragmentu -> ID punktu w Qdrant"""
+
+    def __init__(self, manifest_dir: str):
+        self.manifest_dir = Path(manifest_dir)
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, source: str) -> Path:
+        # Nazwa źródła może zawierać dowolne znaki - nazwa pliku to jej hash
+        name = hashlib.sha256(source.encode("utf-8")).hexdigest()[:32]
+        return self.manifest_dir / f"{name}.json"
+
+    def load(self, source: str) -> Optional[Dict[str, Any]]:
+        """Wczytuje manifest źródła lub zwraca None"""
+        path = self._path(source)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Nie można wczytać manifestu {source}: {e}")
+            return None
+
+    def save(self, source: str, file_hash: str, chunks: Dict[str, str]):
+        """Zapisuje manifest atomowo (plik tymczasowy + rename)"""
+        manifest = {
+            "source": source,
+            "file_hash": file_hash,
+            "updated_at": datetime.now().isoformat(),
+            "chunks": chunks
+        }
+        path = self._path(source)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def delete(self, source: str):
+        """Usuwa manifest źródła"""
+        path = self._path(source)
+        if path.exists():
+            path.unlink()
+
+    def is_unchanged(self, source: str, file_hash: str) -> bool:
+        """Sprawdza czy plik o tym hashu został już zaindeksowany"""
+        manifest = self.load(source)
+        return manifest is not None and manifest.get("file_hash") == file_hash
+
+class CollectionVersion:
+    """Wersja kolekcji w SQLite obok manifestów - wspólna dla wszystkich workerów uvicorn.
+
+    Rośnie przy każdej zmianie punktów; cache odpowiedzi porównuje ją przy odczycie,
+    więc indeksowanie w jednym workerze unieważnia cache we wszystkich.
+    """
+
+    def __init__(self, db_path: str, collection: str):
+        self.db_path = db_path
+        self.collection = collection
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS collection_versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Otwiera połączenie SQLite, zatwierdza zmiany i je zamyka"""
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self) -> int:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (self.collection,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self) -> int:
+        """Zwiększa wersję atomowo (także między procesami) i zwraca nową"""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO collection_versions (collection, version) VALUES (?, 1) "
+                "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                (self.collection,)
+            )
+            (version,) = connection.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (self.collection,)
+            ).fetchone()
+        return version
@@ -0,0 +1,206 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+import asyncio
+import logging
+import time
+from simplybot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Callback postępu indeksowania: (zdarzenie, liczba) - zdarzenia "chunks", "embedded" i "upserted"
+ProgressCallback = Callable[[str, int], None]
+
+# Fragment czekający na embedding: (ID punktu, hash treści, dokument)
+PendingChunk = Tuple[str, str, Dict[str, Any]]
+
+class IngestionPipeline:
+    """Potokowe indeksowanie: ekstrakcja -> embeddingi -> zapis do Qdrant.
+
+    Etapy działają równolegle i są połączone ograniczonymi kolejkami - gdy
+    embeddingi lub Qdrant nie nadążają, ekstrakcja czeka (backpressure), więc
+    w pamięci jest najwyżej kilka paczek niezależnie od rozmiaru pliku.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        embed_workers: int = 2,
+        upsert_workers: int = 2,
+        queue_size: int = 4
+    ):
+        self.vector_store = vector_store
+        self.embed_workers = max(1, embed_workers)
+        self.upsert_workers = max(1, upsert_workers)
+        self.queue_size = max(1, queue_size)
+        # Jeden indeks naraz na źródło - równoległe zadania tego samego pliku
+        # czytałyby ten sam stary manifest i usuwały sobie nawzajem punkty
+        self._source_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def ingest_source(
+        self,
+        source: str,
+        batches: AsyncIterator[List[Dict[str, Any]]],
+        file_hash: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """Re-indexes one source file from a stream of document batches"""
+        async with self._source_locks[source]:
+            return await self._ingest_source(source, batches, file_hash, progress)
+
+    async def _ingest_source(
+        self,
+        source: str,
+        batches: AsyncIterator[List[Dict[str, Any]]],
+        file_hash: str,
+        progress: Optional[ProgressCallback]
+    ) -> Dict[str, Any]:
+        manifests = self.vector_store.manifests
+        manifest = manifests.load(source) or {}
+        if manifest.get("file_hash") == file_hash:
+            logger.info(f"⏭️ Source {source} unchanged - skipping")
+            return {"added": 0, "deleted": 0, "unchanged": len(manifest.get("chunks", {})), "chunks": 0, "skipped_file": True}
+
+        embed_batch_size = max(1, Config.EMBEDDING_BATCH_SIZE)
+        upsert_batch_size = max(1, Config.QDRANT_UPSERT_BATCH_SIZE)
+        embed_queue: "asyncio.Queue[Optional[List[PendingChunk]]]" = asyncio.Queue(self.queue_size)
+        upsert_queue: "asyncio.Queue[Optional[list]]" = asyncio.Queue(self.queue_size)
+
+        old_chunks: Dict[str, str] = manifest.get("chunks", {})
+        new_chunks: Dict[str, str] = {}
+        stats = {
+            "chunks": 0, "changed": 0, "skipped_existing": 0, "added": 0,
+            "extract_s": 0.0, "embedding_s": 0.0, "upsert_s": 0.0,
+            "embed_queue_peak": 0, "upsert_queue_peak": 0
+        }
+
+        def report(event: str, count: int):
+            if progress and count:
+                progress(event, count)
+
+        async def produce():
+            """Etap 1: dzieli fragmenty na nowe i niezmienione, wysyła nowe paczkami do embeddingu"""
+            pending: List[PendingChunk] = []
+            extract_started_at = time.perf_counter()
+            async for documents in batches:
+                stats["extract_s"] += time.perf_counter() - extract_started_at
+                report("chunks", len(documents))
+                for doc in documents:
+                    doc = {**doc, "source": source}
+                    content_hash = self.vector_store.content_hash(doc["content"])
+                    stats["chunks"] += 1
+                    if content_hash in new_chunks:
+                        continue
+                    point_id = self.vector_store.make_point_id(source, content_hash)
+                    new_chunks[content_hash] = point_id
+                    if content_hash in old_chunks:
+                        continue
+                    stats["changed"] += 1
+                    pending.append((point_id, content_hash, doc))
+                    if len(pending) >= embed_batch_size:
+                        await embed_queue.put(pending)
+                        stats["embed_queue_peak"] = max(stats["embed_queue_peak"], embed_queue.qsize())
+                        pending = []
+                extract_started_at = time.perf_counter()
+            if pending:
+                await embed_queue.put(pending)
+            for _ in range(self.embed_workers):
+                await embed_queue.put(None)
+
+        async def embed_worker():
+            """Etap 2: pomija punkty już zapisane i liczy embeddingi paczki"""
+            while True:
+                batch = await embed_queue.get()
+                if batch is None:
+                    return
+                existing_ids = await self.vector_store.get_existing_ids([point_id for point_id, _, _ in batch])
+                if existing_ids:
+                    stats["skipped_existing"] += len(existing_ids)
+                    batch = [item for item in batch if item[0] not in existing_ids]
+                if not batch:
+                    continue
+                started_at = time.perf_counter()
+                vectors = await self.vector_store.encode_texts([doc["content"] for _, _, doc in batch])
+                stats["embedding_s"] += time.perf_counter() - started_at
+                report("embedded", len(batch))
+                points = [
+                    self.vector_store.build_point(point_id, content_hash, doc, vector)
+                    for (point_id, content_hash, doc), vector in zip(batch, vectors)
+                ]
+                await upsert_queue.put(points)
+                stats["upsert_queue_peak"] = max(stats["upsert_queue_peak"], upsert_queue.qsize())
+
+        async def embed_stage():
+            await asyncio.gather(*[embed_worker() for _ in range(self.embed_workers)])
+            for _ in range(self.upsert_workers):
+                await upsert_queue.put(None)
+
+        async def upsert_worker():
+            """Etap 3: zapisuje punkty pełnymi paczkami bez czekania na indeksowanie"""
+            pending_points = []
+            while True:
+                points = await upsert_queue.get()
+                if points is not None:
+                    pending_points.extend(points)
+                # Reszta zostaje do końca, więc ostatni zapis każdego workera czeka (wait=True) -
+                # bariera dla jego wcześniejszych zapisów przed usunięciem nieaktualnych punktów
+                while len(pending_points) > upsert_batch_size or (points is None and pending_points):
+                    chunk = pending_points[:upsert_batch_size]
+                    pending_points = pending_points[upsert_batch_size:]
+                    started_at = time.perf_counter()
+                    await self.vector_store.upsert_points(chunk, wait=not pending_points)
+                    stats["upsert_s"] += time.perf_counter() - started_at
+                    stats["added"] += len(chunk)
+                    report("upserted", len(chunk))
+                if points is None:
+                    return
+
+        started_at = time.perf_counter()
+        await self._run_stages(
+            produce(),
+            embed_stage(),
+            *[upsert_worker() for _ in range(self.upsert_workers)]
+        )
+
+        deleted_count = await self.vector_store.finalize_source(source, manifest, new_chunks, file_hash)
+
+        elapsed = time.perf_counter() - started_at
+        self.vector_store.last_ingest_stats = {
+            "documents": stats["added"],
+            "skipped_duplicates": stats["skipped_existing"],
+            "elapsed_s": round(elapsed, 3),
+            "extract_s": round(stats["extract_s"], 3),
+            "embedding_s": round(stats["embedding_s"], 3),
+            "upsert_s": round(stats["upsert_s"], 3),
+            "chunks_per_s": round(stats["chunks"] / elapsed, 2) if elapsed > 0 else 0.0,
+            "embedding_batch_size": embed_batch_size,
+            "upsert_batch_size": upsert_batch_size,
+            "embed_workers": self.embed_workers,
+            "upsert_workers": self.upsert_workers,
+            "embed_queue_peak": stats["embed_queue_peak"],
+            "upsert_queue_peak": stats["upsert_queue_peak"]
+        }
+
+        result = {
+            "added": stats["added"],
+            "deleted": deleted_count,
+            "unchanged": len(new_chunks) - stats["changed"],
+            "chunks": stats["chunks"],
+            "skipped_file": False
+        }
+        logger.info(
+            f"🔄 Re-indexed {source}: {result} in {elapsed:.2f}s "
+            f"(extract: {stats['extract_s']:.2f}s, embedding: {stats['embedding_s']:.2f}s, upsert: {stats['upsert_s']:.2f}s)"
+        )
+        return result
+
+    @staticmethod
+    async def _run_stages(*stages):
+        """Uruchamia etapy równolegle; błąd jednego etapu anuluje pozostałe"""
+        tasks = [asyncio.ensure_future(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
@@ -0,0 +1,172 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import re
+import time
+import numpy as np
+from simplybot.models import ConversationSummary, NextAction
+from simplybot.services.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Słowa pytające (PL/EN) otwierające pytanie
+INTERROGATIVES = {
+    "how", "what", "where", "why", "when", "which", "who", "whom", "whose",
+    "can", "could", "does", "do", "is", "are", "should", "will", "would",
+    "jak", "co", "gdzie", "dlaczego", "czemu", "kiedy", "który", "która", "które",
+    "czy", "ile", "kto", "jaki", "jaka", "jakie", "skąd", "dokąd", "po co"
+}
+# Powitania i wiadomości bez treści
+SMALL_TALK = {
+    "hi", "hello", "hey", "ok", "okay", "test", "thanks", "thank you", "yes", "no",
+    "cześć", "czesc", "hej", "siema", "witam", "dzień dobry", "dzięki", "dziekuje", "dziękuję", "tak", "nie"
+}
+# Opisy problemu i prośby - wiadomość niesie treść do wyszukania
+PROBLEM_RE = re.compile(
+    r"\b(problem|error|issue|doesn'?t work|not working|need help|i need|how to"
+    r"|błąd|nie działa|nie mogę|potrzebuję|szukam|mam problem)\b",
+    re.IGNORECASE
+)
+WORD_RE = re.compile(r"\w+")
+
+# Przykłady dla klasyfikatora embeddingowego - po jednym centroidzie na NextAction
+PROTOTYPES: Dict[NextAction, List[str]] = {
+    NextAction.RAG_QUERY: [
+        "How does SimplyProject work?",
+        "Where can I find the configuration settings?",
+        "I have a login problem",
+        "I need help with configuration",
+        "Yesterday I had a problem with exporting reports",
+        "Jak skonfigurować uprawnienia użytkownika?",
+        "Gdzie znajdę instrukcję instalacji?",
+        "Mam problem z logowaniem do systemu",
+    ],
+    NextAction.ASK_USER: [
+        "ok",
+        "hi",
+        "test",
+        "thanks",
+        "hmm",
+        "cześć",
+        "dzięki",
+        "no i co",
+    ],
+}
+
+ASK_USER_PROMPT = "Could you describe your question or problem in more detail?"
+
+class IntentClassifier:
+    """Lokalny klasyfikator intencji (rag_query / ask_user) dla rozmów jednoturowych.
+
+    Najpierw reguły, potem najbliższy centroid embeddingów przykładów. Gdy
+    żadna z metod nie jest pewna, zwraca None i decyzję podejmuje LLM.
+    Poziom embeddingowy działa tylko z lokalnym modelem (embed=None go wyłącza) -
+    zdalne embeddingi to wywołanie sieciowe na wiadomość, a nie milisekundy na CPU.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]],
+        min_margin: float = 0.05,
+        enabled: bool = True
+    ):
+        self.embed = embed
+        self.min_margin = min_margin
+        self.enabled = enabled
+        self._centroids: Optional[Tuple[List[NextAction], np.ndarray]] = None
+        self._centroids_lock = asyncio.Lock()
+        self._stats = {"heuristic": 0, "embedding": 0, "llm_fallback": 0, "multi_turn": 0, "classify_ms": 0.0}
+        # Czas lokalnej klasyfikacji osobno dla każdej ścieżki decyzji
+        self._latency = {path: LatencyTracker() for path in ("heuristic", "embedding", "llm_fallback")}
+
+    async def classify(self, conversation: List[Dict[str, str]]) -> Optional[ConversationSummary]:
+        """Zwraca podsumowanie dla pewnych przypadków albo None (decyzja należy do LLM)"""
+        if not self.enabled:
+            return None
+        if len(conversation) != 1 or conversation[0]["role"] != "user":
+            self._stats["multi_turn"] += 1
+            return None
+
+        started_at = time.perf_counter()
+        message = conversation[0]["content"].strip()
+        result = self._classify_heuristic(message)
+        path = "heuristic"
+        if result is None and self.embed is not None:
+            try:
+                result = await self._classify_embedding(message)
+                path = "embedding"
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding intent classifier unavailable: {e}")
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        self._stats["classify_ms"] += elapsed_ms
+
+        if result is None:
+            self._stats["llm_fallback"] += 1
+            self._latency["llm_fallback"].record(elapsed_ms)
+            logger.info(f"🤷 Local intent classifier unsure ({elapsed_ms:.1f} ms) - falling back to LLM")
+            return None
+
+        action, confidence, reasoning = result
+        self._stats[path] += 1
+        self._latency[path].record(elapsed_ms)
+        logger.info(f"⚡ Local intent ({path}, {elapsed_ms:.1f} ms): {action.value} (confidence: {confidence:.2f})")
+        return ConversationSummary(
+            conversation_summary=message,
+            rag_query=message if action == NextAction.RAG_QUERY else ASK_USER_PROMPT,
+            next_action=action,
+            confidence=confidence,
+            reasoning=f"Local classifier ({path}): {reasoning}"
+        )
+
+    def _classify_heuristic(self, message: str) -> Optional[Tuple[NextAction, float, str]]:
+        normalized = " ".join(WORD_RE.findall(message.lower()))
+        words = normalized.split()
+        if len(message) < 3:
+            return NextAction.ASK_USER, 0.9, "message shorter than 3 characters"
+        if normalized in SMALL_TALK:
+            return NextAction.ASK_USER, 0.9, "greeting or filler message"
+        if len(words) >= 3 and (message.endswith("?") or words[0] in INTERROGATIVES or " ".join(words[:2]) in INTERROGATIVES):
+            return NextAction.RAG_QUERY, 0.9, "question"
+        if len(words) >= 3 and PROBLEM_RE.search(message):
+            return NextAction.RAG_QUERY, 0.85, "problem description or request"
+        return None
+
+    async def _get_centroids(self) -> Tuple[List[NextAction], np.ndarray]:
+        """Liczy centroidy przykładów przy pierwszym użyciu"""
+        async with self._centroids_lock:
+            if self._centroids is None:
+                labels = list(PROTOTYPES)
+                centroids = []
+                for label in labels:
+                    vectors = np.asarray(await asyncio.gather(*[self.embed(text) for text in PROTOTYPES[label]]), dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                    centroid = vectors.mean(axis=0)
+                    centroids.append(centroid / np.linalg.norm(centroid))
+                self._centroids = (labels, np.stack(centroids))
+            return self._centroids
+
+    async def _classify_embedding(self, message: str) -> Optional[Tuple[NextAction, float, str]]:
+        labels, centroids = await self._get_centroids()
+        vector = np.asarray(await self.embed(message), dtype=np.float32)
+        similarities = centroids @ (vector / np.linalg.norm(vector))
+        order = np.argsort(similarities)[::-1]
+        margin = float(similarities[order[0]] - similarities[order[1]])
+        if margin < self.min_margin:
+            return None
+        return labels[order[0]], min(0.9, 0.5 + margin), f"nearest prototype centroid (margin {margin:.3f})"
+
+    def get_stats(self) -> Dict[str, object]:
+        """Zwraca liczniki ścieżek decyzji"""
+        local = self._stats["heuristic"] + self._stats["embedding"]
+        classified = local + self._stats["llm_fallback"]
+        return {
+            "heuristic": self._stats["heuristic"],
+            "embedding": self._stats["embedding"],
+            "llm_fallback": self._stats["llm_fallback"],
+            "multi_turn": self._stats["multi_turn"],
+            "local_rate": round(local / classified, 4) if classified else 0.0,
+            "avg_classify_ms": round(self._stats["classify_ms"] / classified, 2) if classified else 0.0,
+            "latency_ms": {path: tracker.summary() for path, tracker in self._latency.items()},
+            "embedding_tier": self.embed is not None,
+            "enabled": self.enabled
+        }
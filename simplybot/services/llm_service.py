@@ -2,37 +2,240 @@ from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
 from simplybot.config import Config
 from simplybot.models import ConversationSummary, NextAction
-from typing import List, Dict, Any
+from simplybot.services.chunker import get_prompt_token_counter
+from simplybot.services.context_packer import ContextPacker
+from simplybot.services.metrics import LatencyTracker
+from simplybot.services.resilience import ResilienceLayer, UpstreamUnavailableError
+from simplybot.services.single_flight import SingleFlight
+from collections import defaultdict
+from typing import List, Dict, Any, AsyncIterator, Optional
+import hashlib
 import logging
 import json
+import time
 
 logger = logging.getLogger(__name__)
 
+# Prompty systemowe są stałymi modułu - identyczny prefiks każdego wywołania pozwala
+# dostawcy (OpenAI/OpenRouter) użyć automatycznego cache promptu; zmienne części idą na końcu
+SUMMARIZE_SYSTEM_PROMPT = """\
+You are an expert in analyzing conversations and user intentions. Your task is to:
+1. Analyze the content of user's message
+2. Identify whether the user:
+   - Asked a specific question
+   - Made a statement or fact
+   - Described a situation or problem
+   - Sent unclear or too short message
+3. Decide whether to prepare a query to knowledge base or ask user for more information
+4. Estimate analysis confidence (0.0-1.0)
+
+Respond in JSON format:
+{
+    "conversation_summary": "brief conversation summary",
+    "rag_query": "specific query to knowledge base or question to user",
+    "next_action": "rag_query" or "ask_user",
+    "confidence": 0.0-1.0,
+    "reasoning": "reasoning for chosen action"
+}
+
+Analysis rules:
+- If user asked specific question (e.g. "How does X work?", "Where can I find Y?") -> next_action: "rag_query"
+- If user made statement or fact (e.g. "I have a problem with X", "I need Y") -> next_action: "rag_query"
+- If user described situation (e.g. "Yesterday I had a problem with...", "I'm looking for a solution for...") -> next_action: "rag_query"
+- If message is too short (e.g. "ok", "hi", "test") -> next_action: "ask_user"
+- If message is unclear or doesn't contain specific information -> next_action: "ask_user"
+- If lacks context to understand intention -> next_action: "ask_user"
+
+Examples:
+- "How does SimplyProject work?" -> rag_query (specific question)
+- "I have a login problem" -> rag_query (problem description)
+- "I need help with configuration" -> rag_query (statement)
+- "ok" -> ask_user (too short)
+- "hi" -> ask_user (no specific information)
+- "test" -> ask_user (unclear)
+"""
+
+ROLLING_SUMMARY_SYSTEM_PROMPT = """\
+You maintain a running summary of a support conversation. Update the existing summary
+with the new messages. Keep facts, user goals, problems and answers already given.
+Respond with the updated summary only, at most 150 words.
+"""
+
+ANSWER_SYSTEM_PROMPT = """\
+You are a helpful assistant. Answer user questions based on
+provided documents. If you cannot find the answer in documents,
+respond exactly: "I don't have information". If you don't understand the question or no question arises from the conversation, you can ask the user for more information.
+
+Responses MUST be in format:
+
+**TLDR:** [One line with quick, concise answer]
+
+**Description:** [Detailed description with additional information, context and explanations]
+
+Responses should be:
+- Accurate and based on facts from documents
+- TLDR should be very concise (1-2 sentences)
+- Description can be longer and contain details
+- In English
+"""
+
+# Rodzaj wywołania -> model: klasyfikacja/podsumowania idą do szybkiego modelu, odpowiedzi do mocnego
+ROUTE_MODELS = {
+    "summarize": "fast",
+    "rolling_summary": "fast",
+    "answer": "strong",
+    "answer_stream": "strong",
+}
+
 class LLMService:
     def __init__(self):
         # Check if we're using OpenRouter or OpenAI
         if Config.OPENROUTER_API_KEY:
             # Use OpenRouter (main LLM configuration)
-            self.llm = ChatOpenAI(
-                api_key=Config.OPENROUTER_API_KEY,
-                base_url=Config.OPENROUTER_BASE_URL,
-                model=Config.OPENROUTER_MODEL,
-                temperature=Config.TEMPERATURE,
-                max_tokens=Config.MAX_TOKENS
-            )
+            client_kwargs = {"api_key": Config.OPENROUTER_API_KEY, "base_url": Config.OPENROUTER_BASE_URL}
+            strong_model = Config.ANSWER_MODEL or Config.OPENROUTER_MODEL
+            fast_model = Config.SUMMARIZE_MODEL or "openai/gpt-4o-mini"
         elif Config.OPENAI_API_KEY:
             # Fallback to OpenAI (if no OpenRouter)
-            self.llm = ChatOpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                model=Config.OPENAI_MODEL,
-                temperature=Config.TEMPERATURE,
-                max_tokens=Config.MAX_TOKENS
-            )
+            client_kwargs = {"api_key": Config.OPENAI_API_KEY}
+            strong_model = Config.ANSWER_MODEL or Config.OPENAI_MODEL
+            fast_model = Config.SUMMARIZE_MODEL or "gpt-4o-mini"
         else:
             raise ValueError("No API key - set OPENROUTER_API_KEY or OPENAI_API_KEY")
+        
+        # Każda trasa ma własny model, limit tokenów, temperaturę i timeout
+        self.llms = {
+            "fast": ChatOpenAI(
+                **client_kwargs,
+                model=fast_model,
+                temperature=Config.SUMMARIZE_TEMPERATURE,
+                max_tokens=Config.SUMMARIZE_MAX_TOKENS,
+                timeout=Config.SUMMARIZE_TIMEOUT,
+                max_retries=0
+            ),
+            "strong": ChatOpenAI(
+                **client_kwargs,
+                model=strong_model,
+                temperature=Config.ANSWER_TEMPERATURE,
+                max_tokens=Config.ANSWER_MAX_TOKENS,
+                timeout=Config.ANSWER_TIMEOUT,
+                max_retries=0
+            ),
+        }
+        self.models = {"fast": fast_model, "strong": strong_model}
+        
+        # Obie trasy korzystają z tego samego dostawcy - wspólne limity i polityka ponowień
+        # (ponowienia klienta OpenAI są wyłączone, żeby nie mnożyć prób)
+        self.resilience = ResilienceLayer(
+            name="openrouter" if Config.OPENROUTER_API_KEY else "openai",
+            max_concurrency=Config.LLM_MAX_CONCURRENCY,
+            rate_per_second=Config.LLM_RATE_LIMIT,
+            burst=Config.LLM_RATE_BURST,
+            max_retries=Config.LLM_MAX_RETRIES,
+            base_delay=Config.LLM_RETRY_BASE_DELAY,
+            max_delay=Config.LLM_RETRY_MAX_DELAY,
+            hedging=Config.LLM_HEDGING,
+            hedge_min_delay=Config.LLM_HEDGE_MIN_DELAY,
+            hedge_min_samples=Config.LLM_HEDGE_MIN_SAMPLES
+        )
+        logger.info(f"🔀 LLM routing: summaries -> {fast_model}, answers -> {strong_model}")
+        
+        self._usage: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "estimated_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        self._latency: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        
+        self.single_flight = SingleFlight("llm")
+        
+        # Kontekst odpowiedzi jest przycinany do budżetu tokenów (liczonych tokenizerem modelu odpowiedzi)
+        self.context_packer = ContextPacker(
+            max_tokens=Config.CONTEXT_MAX_TOKENS,
+            count_tokens=get_prompt_token_counter(strong_model),
+            duplicate_threshold=Config.CONTEXT_DUPLICATE_THRESHOLD
+        )
+    
+    def _request_key(self, route: str, messages: List) -> str:
+        """Klucz wywołania: model, parametry i znormalizowana treść wiadomości"""
+        llm = self.llms[ROUTE_MODELS[route]]
+        payload = json.dumps({
+            "model": llm.model_name,
+            "temperature": llm.temperature,
+            "max_tokens": llm.max_tokens,
+            "messages": [(message.type, " ".join(str(message.content).split())) for message in messages]
+        }, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _invoke(self, route: str, messages: List):
+        """Wywołuje LLM i zapisuje czas oraz zużycie tokenów (w tym z cache promptu).
+
+        Równoczesne identyczne wywołania współdzielą jedno zapytanie do dostawcy.
+        """
+        async def call():
+            started_at = time.perf_counter()
+            llm = self.llms[ROUTE_MODELS[route]]
+            response = await self.resilience.call(route, lambda: llm.ainvoke(messages))
+            self._record_usage(route, response, time.perf_counter() - started_at)
+            return response
+        
+        return await self.single_flight.do(self._request_key(route, messages), call)
+    
+    @staticmethod
+    def _extract_usage(response) -> Dict[str, int]:
+        """Wyciąga liczby tokenów z odpowiedzi (usage_metadata lub surowe token_usage dostawcy)"""
+        usage_metadata = getattr(response, "usage_metadata", None) or {}
+        if usage_metadata:
+            details = usage_metadata.get("input_token_details") or {}
+            return {
+                "prompt_tokens": usage_metadata.get("input_tokens", 0),
+                "completion_tokens": usage_metadata.get("output_tokens", 0),
+                "cached_tokens": details.get("cache_read", 0) or 0
+            }
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        details = token_usage.get("prompt_tokens_details") or {}
+        return {
+            "prompt_tokens": token_usage.get("prompt_tokens", 0),
+            "completion_tokens": token_usage.get("completion_tokens", 0),
+            "cached_tokens": details.get("cached_tokens", 0) or 0
+        }
     
-    async def summarize_conversation(self, conversation: List[Dict[str, str]]) -> ConversationSummary:
-        """Podsumowuje rozmowę i przygotowuje zapytanie do RAG z zabezpieczeniem"""
+    def _estimate_usage(self, messages: List, answer_parts: List[str]) -> Dict[str, int]:
+        """Szacuje zużycie tokenów tokenizerem modelu odpowiedzi, gdy dostawca go nie zwrócił"""
+        count_tokens = self.context_packer.count_tokens
+        return {
+            "prompt_tokens": sum(count_tokens(str(message.content)) for message in messages),
+            "completion_tokens": count_tokens("".join(answer_parts)),
+            "cached_tokens": 0
+        }
+    
+    def _record_usage(self, route: str, response, elapsed_s: float, usage: Optional[Dict[str, int]] = None):
+        """Zapisuje zużycie z odpowiedzi; przekazane usage to szacunek (liczony w estimated_calls)"""
+        stats = self._usage[route]
+        if usage is not None:
+            stats["estimated_calls"] += 1
+        else:
+            usage = self._extract_usage(response) if response is not None else {}
+        stats["calls"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            stats[key] += usage.get(key, 0)
+        self._latency[route].record(elapsed_s * 1000)
+        if usage.get("prompt_tokens"):
+            logger.info(
+                f"🧮 LLM {route}: {usage['prompt_tokens']} prompt tokens "
+                f"({usage['cached_tokens']} cached), {usage['completion_tokens']} completion tokens in {elapsed_s * 1000:.0f} ms"
+            )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Zwraca zużycie tokenów i czasy wywołań per rodzaj wywołania"""
+        return {
+            route: {
+                **stats,
+                "model": self.models[ROUTE_MODELS[route]],
+                "cached_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0,
+                "latency_ms": self._latency[route].summary()
+            }
+            for route, stats in self._usage.items()
+        }
+    
+    async def summarize_conversation(self, conversation: List[Dict[str, str]], rolling_summary: str = "") -> ConversationSummary:
+        """Podsumowuje rozmowę i przygotowuje zapytanie do RAG z zabezpieczeniem (rolling_summary - podsumowanie starszej części rozmowy)"""
         try:
             # Logowanie rozpoczęcia podsumowywania
             logger.info(f"🧠 Rozpoczynam podsumowywanie rozmowy ({len(conversation)} wiadomości)")
@@ -53,6 +256,8 @@ class LLMService:
                 f"{msg['role']}: {msg['content']}" 
                 for msg in conversation
             ])
+            if rolling_summary:
+                conversation_text = f"Podsumowanie wcześniejszej części rozmowy: {rolling_summary}\n\n{conversation_text}"
             
             # Logowanie ostatniej wiadomości użytkownika
             last_user_message = next((msg['content'] for msg in reversed(conversation) if msg['role'] == 'user'), '')
@@ -70,49 +275,12 @@ class LLMService:
                     reasoning="Last user message has less than 3 characters - more details needed"
                 )
             
-            system_prompt = """
-            You are an expert in analyzing conversations and user intentions. Your task is to:
-            1. Analyze the content of user's message
-            2. Identify whether the user:
-               - Asked a specific question
-               - Made a statement or fact
-               - Described a situation or problem
-               - Sent unclear or too short message
-            3. Decide whether to prepare a query to knowledge base or ask user for more information
-            4. Estimate analysis confidence (0.0-1.0)
-            
-            Respond in JSON format:
-            {
-                "conversation_summary": "brief conversation summary",
-                "rag_query": "specific query to knowledge base or question to user",
-                "next_action": "rag_query" or "ask_user",
-                "confidence": 0.0-1.0,
-                "reasoning": "reasoning for chosen action"
-            }
-            
-            Analysis rules:
-            - If user asked specific question (e.g. "How does X work?", "Where can I find Y?") -> next_action: "rag_query"
-            - If user made statement or fact (e.g. "I have a problem with X", "I need Y") -> next_action: "rag_query"
-            - If user described situation (e.g. "Yesterday I had a problem with...", "I'm looking for a solution for...") -> next_action: "rag_query"
-            - If message is too short (e.g. "ok", "hi", "test") -> next_action: "ask_user"
-            - If message is unclear or doesn't contain specific information -> next_action: "ask_user"
-            - If lacks context to understand intention -> next_action: "ask_user"
-            
-            Examples:
-            - "How does SimplyProject work?" -> rag_query (specific question)
-            - "I have a login problem" -> rag_query (problem description)
-            - "I need help with configuration" -> rag_query (statement)
-            - "ok" -> ask_user (too short)
-            - "hi" -> ask_user (no specific information)
-            - "test" -> ask_user (unclear)
-            """
-            
             messages = [
-                SystemMessage(content=system_prompt),
+                SystemMessage(content=SUMMARIZE_SYSTEM_PROMPT),
                 HumanMessage(content=f"Rozmowa:\n{conversation_text}")
             ]
             
-            response = await self.llm.ainvoke(messages)
+            response = await self._invoke("summarize", messages)
             
             # Logowanie odpowiedzi
             response_preview = response.content[:50] + "..." if len(response.content) > 50 else response.content
@@ -152,6 +320,8 @@ class LLMService:
                     reasoning=f"Błąd parsowania JSON: {str(e)}"
                 )
             
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"❌ Błąd podczas podsumowywania rozmowy: {e}")
             return ConversationSummary(
@@ -162,8 +332,39 @@ class LLMService:
                 reasoning=f"Błąd systemu: {str(e)}"
             )
     
-    async def answer_with_context(self, question: str, context_docs: List[Dict[str, Any]]) -> str:
-        """Odpowiada na pytanie używając kontekstu z dokumentów"""
+    async def update_rolling_summary(self, summary: str, new_messages: List[Dict[str, str]]) -> str:
+        """Aktualizuje kroczące podsumowanie rozmowy na podstawie tylko nowych wiadomości"""
+        messages_text = "\n".join(f"{msg['role']}: {msg['content']}" for msg in new_messages)
+        messages = [
+            SystemMessage(content=ROLLING_SUMMARY_SYSTEM_PROMPT),
+            HumanMessage(content=f"Dotychczasowe podsumowanie:\n{summary or '(brak)'}\n\nNowe wiadomości:\n{messages_text}")
+        ]
+        response = await self._invoke("rolling_summary", messages)
+        logger.info(f"🧾 Rolling summary updated with {len(new_messages)} messages")
+        return response.content.strip()
+    
+    def _build_answer_messages(self, question: str, context_docs: List[Dict[str, Any]], pack: bool = True) -> List:
+        """Buduje wiadomości dla odpowiedzi z kontekstem dokumentów (pack=False - kontekst bez przycinania)"""
+        if pack:
+            context_docs = self.context_packer.pack(context_docs)
+        
+        # Przygotuj kontekst z dokumentów
+        context_text = "\n\n".join([
+            f"Dokument {i+1}:\n{doc.get('content', '')}"
+            for i, doc in enumerate(context_docs)
+        ])
+        
+        # Logowanie informacji o kontekście
+        context_preview = context_text[:50] + "..." if len(context_text) > 50 else context_text
+        logger.info(f"📚 Kontekst przygotowany: '{context_preview}'")
+        
+        return [
+            SystemMessage(content=ANSWER_SYSTEM_PROMPT),
+            HumanMessage(content=f"Kontekst:\n{context_text}\n\nPytanie: {question}")
+        ]
+    
+    async def answer_with_context(self, question: str, context_docs: List[Dict[str, Any]], pack: bool = True) -> str:
+        """Odpowiada na pytanie używając kontekstu z dokumentów (pack=False dla kontekstu, który nie pochodzi z wyszukiwania)"""
         try:
             # Logowanie rozpoczęcia generowania odpowiedzi
             question_preview = question[:10] + "..." if len(question) > 10 else question
@@ -173,40 +374,7 @@ class LLMService:
                 logger.warning("⚠️ Brak dokumentów kontekstowych - zwracam domyślną odpowiedź")
                 return "Nie posiadam informacji"
             
-            # Przygotuj kontekst z dokumentów
-            context_text = "\n\n".join([
-                f"Dokument {i+1}:\n{doc.get('content', '')}"
-                for i, doc in enumerate(context_docs)
-            ])
-            
-            # Logowanie informacji o kontekście
-            context_preview = context_text[:50] + "..." if len(context_text) > 50 else context_text
-            logger.info(f"📚 Kontekst przygotowany: '{context_preview}'")
-            
-            system_prompt = """
-            You are a helpful assistant. Answer user questions based on 
-            provided documents. If you cannot find the answer in documents, 
-            respond exactly: "I don't have information". If you don't understand the question or no question arises from the conversation, you can ask the user for more information. 
-            
-            Responses MUST be in format:
-            
-            **TLDR:** [One line with quick, concise answer]
-            
-            **Description:** [Detailed description with additional information, context and explanations]
-            
-            Responses should be:
-            - Accurate and based on facts from documents
-            - TLDR should be very concise (1-2 sentences)
-            - Description can be longer and contain details
-            - In English
-            """
-            
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"Kontekst:\n{context_text}\n\nPytanie: {question}")
-            ]
-            
-            response = await self.llm.ainvoke(messages)
+            response = await self._invoke("answer", self._build_answer_messages(question, context_docs, pack))
             
             # Log generated response
             answer_preview = response.content[:10] + "..." if len(response.content) > 10 else response.content
@@ -214,6 +382,47 @@ class LLMService:
             
             return response.content
             
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return "I don't have information" 
\ No newline at end of file
+            return "I don't have information"
+    
+    async def stream_answer_with_context(self, question: str, context_docs: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Odpowiada na pytanie z kontekstem, zwracając tokeny w miarę generowania"""
+        question_preview = question[:10] + "..." if len(question) > 10 else question
+        logger.info(f"🤖 Streaming odpowiedzi dla pytania: '{question_preview}' (kontekst: {len(context_docs)} dokumentów)")
+        
+        if not context_docs:
+            logger.warning("⚠️ Brak dokumentów kontekstowych - zwracam domyślną odpowiedź")
+            yield "Nie posiadam informacji"
+            return
+        
+        streamed_any = False
+        started_at = time.perf_counter()
+        usage_chunk = None
+        answer_parts = []
+        try:
+            # Bez include_usage OpenAI nie wysyła zużycia tokenów w trybie strumieniowym
+            llm = self.llms[ROUTE_MODELS["answer_stream"]].bind(stream_options={"include_usage": True})
+            messages = self._build_answer_messages(question, context_docs)
+            async for chunk in self.resilience.stream("answer_stream", lambda: llm.astream(messages)):
+                # Zużycie przychodzi w ostatnim fragmencie (bez treści)
+                if self._extract_usage(chunk).get("prompt_tokens"):
+                    usage_chunk = chunk
+                if chunk.content:
+                    streamed_any = True
+                    answer_parts.append(chunk.content)
+                    yield chunk.content
+            elapsed_s = time.perf_counter() - started_at
+            if usage_chunk is None:
+                # Starsze wersje langchain-openai pomijają fragment z samym zużyciem - szacujemy tokenizerem
+                self._record_usage("answer_stream", None, elapsed_s, usage=self._estimate_usage(messages, answer_parts))
+            else:
+                self._record_usage("answer_stream", usage_chunk, elapsed_s)
+        except UpstreamUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            if not streamed_any:
+                yield "I don't have information"
@@ -0,0 +1,63 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+import threading
+import time
+import numpy as np
+
+class LatencyTracker:
+    """Przesuwne okno ostatnich pomiarów (czasów w ms lub innych wartości) z percentylami"""
+
+    def __init__(self, window: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._count = 0
+
+    def record(self, value: float):
+        self._samples.append(value)
+        self._count += 1
+
+    def summary(self) -> Dict[str, float]:
+        if not self._samples:
+            return {"count": 0, "p50": 0.0, "p95": 0.0, "avg": 0.0}
+        samples = np.fromiter(self._samples, dtype=np.float64)
+        return {
+            "count": self._count,
+            "p50": round(float(np.percentile(samples, 50)), 1),
+            "p95": round(float(np.percentile(samples, 95)), 1),
+            "avg": round(float(samples.mean()), 1)
+        }
+
+class MetricsRegistry:
+    """Nazwane liczniki i pomiary czasu dla /metrics"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float):
+        with self._lock:
+            if name not in self._trackers:
+                self._trackers[name] = LatencyTracker(self.window)
+            self._trackers[name].record(value)
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Mierzy czas bloku (także z await w środku) w milisekundach"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started_at) * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency": {name: tracker.summary() for name, tracker in sorted(self._trackers.items())},
+                "counters": dict(sorted(self._counters.items()))
+            }
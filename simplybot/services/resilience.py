@@ -0,0 +1,247 @@
+from collections import defaultdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import logging
+import random
+import time
+import openai
+from simplybot.services.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class UpstreamUnavailableError(Exception):
+    """Dostawca nie odpowiedział poprawnie mimo ponowień (limity, błędy 5xx, timeouty)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdaptiveTokenBucket:
+    """Token bucket, którego tempo spada o połowę po 429 i wraca liniowo po sukcesach"""
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Czeka na token - kolejne wywołania są obsługiwane w kolejności przybycia"""
+        if not self.enabled:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_throttle(self):
+        if not self.enabled:
+            return
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        # Nie wysyłaj zaległej serii zapytań zaraz po 429
+        self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        if self.enabled and self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+class ResilienceLayer:
+    """Limit współbieżności, adaptacyjny rate limit, ponowienia i hedging wywołań dostawcy.
+
+    Ponawiane są tylko błędy przejściowe (429, 5xx, timeouty i błędy połączenia)
+    z wykładniczym opóźnieniem z pełnym jitterem (z uwzględnieniem Retry-After).
+    Hedging wysyła drugie zapytanie, gdy pierwsze trwa dłużej niż p95 danego
+    rodzaju wywołania - wygrywa szybsze, drugie jest anulowane.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        rate_per_second: float = 0.0,
+        burst: int = 10,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedging: bool = False,
+        hedge_min_delay: float = 1.0,
+        hedge_min_samples: int = 20
+    ):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.max_concurrency = max(1, max_concurrency)
+        self._bucket = AdaptiveTokenBucket(rate_per_second, burst)
+        self._latency: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        self._in_flight = 0
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "throttled": 0, "failures": 0, "hedges": 0, "hedge_wins": 0}
+
+    @staticmethod
+    def _status_code(error: Exception) -> Optional[int]:
+        return getattr(error, "status_code", None)
+
+    @classmethod
+    def is_retryable(cls, error: Exception) -> bool:
+        status_code = cls._status_code(error)
+        if status_code is not None:
+            return status_code == 429 or status_code >= 500
+        return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _on_error(self, error: Exception):
+        if self._status_code(error) == 429:
+            self._stats["throttled"] += 1
+            self._bucket.on_throttle()
+
+    def _hedge_delay(self, key: str) -> Optional[float]:
+        """Opóźnienie drugiego zapytania (p95 w sekundach) - None, gdy hedging wyłączony lub brak pomiarów"""
+        if not self.hedging:
+            return None
+        summary = self._latency[key].summary()
+        if summary["count"] < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, summary["p95"] / 1000)
+
+    async def _call_once(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        async with self._semaphore:
+            await self._bucket.acquire()
+            self._stats["attempts"] += 1
+            self._in_flight += 1
+            started_at = time.perf_counter()
+            try:
+                result = await func()
+            except Exception as e:
+                self._on_error(e)
+                raise
+            finally:
+                self._in_flight -= 1
+        self._bucket.on_success()
+        self._latency[key].record((time.perf_counter() - started_at) * 1000)
+        return result
+
+    async def _attempt(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        hedge_delay = self._hedge_delay(key)
+        primary = asyncio.ensure_future(self._call_once(key, func))
+        if hedge_delay is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done:
+                self._stats["hedges"] += 1
+                logger.info(f"🏎️ Hedging {self.name} {key} call after {hedge_delay * 1000:.0f} ms")
+                pending.add(asyncio.ensure_future(self._call_once(key, func)))
+            error: Optional[BaseException] = None
+            while done or pending:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Wywołuje func() z limitami i ponowieniami (key - rodzaj wywołania dla p95 hedgingu)"""
+        self._stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._attempt(key, func)
+            except Exception as e:
+                await self._handle_failure(key, attempt, e)
+
+    async def stream(self, key: str, func: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Jak call(), ale dla strumienia - ponawiane tylko, zanim dotrze pierwszy element"""
+        self._stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._semaphore:
+                    await self._bucket.acquire()
+                    self._stats["attempts"] += 1
+                    self._in_flight += 1
+                    try:
+                        async for item in func():
+                            started = True
+                            yield item
+                    finally:
+                        self._in_flight -= 1
+                self._bucket.on_success()
+                return
+            except Exception as e:
+                self._on_error(e)
+                if started:
+                    raise
+                await self._handle_failure(key, attempt, e)
+
+    async def _handle_failure(self, key: str, attempt: int, error: Exception):
+        """Czeka przed ponowieniem albo zgłasza błąd (nieprzejściowy lub po ostatniej próbie)"""
+        if not self.is_retryable(error):
+            self._stats["failures"] += 1
+            raise error
+        if attempt >= self.max_retries:
+            self._stats["failures"] += 1
+            raise UpstreamUnavailableError(
+                f"{self.name} unavailable after {attempt + 1} attempts: {error}",
+                retry_after=self._retry_after(error)
+            ) from error
+        delay = self._backoff_delay(attempt, error)
+        self._stats["retries"] += 1
+        logger.warning(f"🔁 {self.name} {key} call failed ({error.__class__.__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": round(self._bucket.rate, 2) if self._bucket.enabled else None,
+            "latency_ms": {key: tracker.summary() for key, tracker in sorted(self._latency.items())}
+        }
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import logging
+import threading
+import time
+import uuid
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedAnswer:
+    """Odpowiedź RAG zapamiętana dla embeddingu zapytania"""
+    rag_query: str
+    answer: str
+    point_ids: List[str]
+    sources: List[Dict[str, Any]]
+    confidence: float
+    latency_ms: float
+    created_at: float = field(default_factory=time.time)
+
+class SemanticCache:
+    """Cache odpowiedzi RAG wyszukujący po podobieństwie cosinusowym embeddingów rag_query.
+
+    Wpisy mają TTL i są usuwane w kolejności LRU. Każdy wpis pamięta wersję
+    kolekcji Qdrant - po dodaniu lub usunięciu dokumentów cały cache jest unieważniany.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: int = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._vectors: Dict[str, np.ndarray] = {}
+        # Macierz znormalizowanych wektorów budowana leniwie po zmianie wpisów
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "invalidations": 0, "latency_saved_ms": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _sync_version(self, version: int):
+        """Czyści cache, jeśli kolekcja zmieniła się od zapisania wpisów"""
+        if self._version != version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+                logger.info(f"♻️ Semantic cache invalidated ({len(self._entries)} entries, collection version {version})")
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+            self._version = version
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+        self._matrix = None
+
+    def lookup(self, vector: List[float], version: int) -> Optional[CachedAnswer]:
+        """Zwraca zapamiętaną odpowiedź dla najbardziej podobnego zapytania powyżej progu"""
+        if not self.enabled:
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            self._sync_version(version)
+            now = time.time()
+            for key in [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]:
+                self._remove(key)
+
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._vectors)
+                    self._matrix = np.stack([self._vectors[key] for key in self._matrix_keys])
+                similarities = self._matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key = self._matrix_keys[best]
+                    entry = self._entries[key]
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["latency_saved_ms"] += entry.latency_ms
+                    logger.info(f"⚡ Semantic cache hit (similarity: {similarities[best]:.4f}, query: '{entry.rag_query[:30]}')")
+                    return entry
+
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, vector: List[float], version: int, entry: CachedAnswer):
+        """Zapisuje odpowiedź dla embeddingu zapytania"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._sync_version(version)
+            key = uuid.uuid4().hex
+            self._entries[key] = entry
+            self._vectors[key] = self._normalize(vector)
+            self._matrix = None
+            self._stats["writes"] += 1
+            while len(self._entries) > self.max_size:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Zwraca statystyki cache"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "latency_saved_ms": round(self._stats["latency_saved_ms"], 1),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "enabled": self.enabled
+            }
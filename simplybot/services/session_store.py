@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# (dotychczasowe podsumowanie, nowe wiadomości) -> nowe podsumowanie
+SummarizeFn = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+class UnknownSessionError(Exception):
+    """Delta dla sesji, której serwer nie zna (wygasła, restart, inny worker) - klient musi wysłać pełny zapis"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Unknown session {session_id} - resend the full conversation")
+        self.session_id = session_id
+
+class SessionState:
+    """Stan rozmowy: kroczące podsumowanie starszej części + ostatnie wiadomości"""
+
+    def __init__(self):
+        self.summary = ""
+        self.recent: List[Dict[str, str]] = []
+        # Wiadomości wypchnięte z okna, jeszcze niewłączone do podsumowania
+        self.pending: List[Dict[str, str]] = []
+        self.message_count = 0
+        self.updated_at = time.time()
+        self.folding: Optional[asyncio.Task] = None
+
+class SessionStore:
+    """Sesje rozmów po session_id z ograniczoną pamięcią (LRU + TTL).
+
+    Starsze wiadomości są w tle dołączane do podsumowania - LLM dostaje tylko
+    nowe wiadomości i poprzednie podsumowanie, a nie cały zapis rozmowy.
+    """
+
+    def __init__(self, summarize: SummarizeFn, max_sessions: int = 1000, ttl_seconds: int = 3600, max_recent_messages: int = 6):
+        self.summarize = summarize
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_recent_messages = max(1, max_recent_messages)
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {
+            "created": 0, "evicted": 0, "expired": 0, "rejected_deltas": 0,
+            "folds": 0, "folded_messages": 0, "fold_errors": 0, "dropped_messages": 0
+        }
+
+    def _evict(self):
+        now = time.time()
+        for session_id in [sid for sid, state in self._sessions.items() if now - state.updated_at > self.ttl_seconds]:
+            self._drop(session_id)
+            self._stats["expired"] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)))
+            self._stats["evicted"] += 1
+
+    def _drop(self, session_id: str):
+        state = self._sessions.pop(session_id)
+        if state.folding is not None:
+            state.folding.cancel()
+
+    def _get(self, session_id: str) -> SessionState:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = SessionState()
+            self._sessions[session_id] = state
+            self._stats["created"] += 1
+        self._sessions.move_to_end(session_id)
+        state.updated_at = time.time()
+        self._evict()
+        return state
+
+    def require(self, session_id: str):
+        """Zgłasza UnknownSessionError, jeśli sesji nie ma (albo właśnie wygasła)"""
+        self._evict()
+        if session_id not in self._sessions:
+            self._stats["rejected_deltas"] += 1
+            raise UnknownSessionError(session_id)
+
+    def update(self, session_id: str, messages: List[Dict[str, str]], is_delta: bool) -> Tuple[str, List[Dict[str, str]]]:
+        """Dodaje wiadomości (delta lub pełny zapis) i zwraca (podsumowanie, wiadomości do promptu).
+
+        Delta dla nieznanej sesji jest odrzucana (UnknownSessionError) zamiast zaczynać pustą rozmowę.
+        """
+        if is_delta:
+            self.require(session_id)
+        state = self._get(session_id)
+        if is_delta:
+            new_messages = messages
+        elif len(messages) < state.message_count:
+            # Krótszy pełny zapis - klient zaczął rozmowę od nowa
+            self._drop(session_id)
+            state = self._get(session_id)
+            new_messages = messages
+        else:
+            # Pełny zapis - liczą się tylko wiadomości, których sesja jeszcze nie zna
+            new_messages = messages[state.message_count:]
+        self._append(state, new_messages)
+        return self.context(session_id)
+
+    def add_message(self, session_id: Optional[str], role: str, content: str):
+        """Zapisuje wiadomość w sesji (np. odpowiedź bota)"""
+        if session_id is None or session_id not in self._sessions:
+            return
+        self._append(self._sessions[session_id], [{"role": role, "content": content}])
+
+    def context(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        state = self._sessions[session_id]
+        # Wiadomości w trakcie dołączania do podsumowania nadal trafiają do promptu
+        return state.summary, state.pending + state.recent
+
+    def _append(self, state: SessionState, messages: List[Dict[str, str]]):
+        state.recent.extend(messages)
+        state.message_count += len(messages)
+        overflow = len(state.recent) - self.max_recent_messages
+        if overflow > 0:
+            state.pending.extend(state.recent[:overflow])
+            state.recent = state.recent[overflow:]
+        # Gdy podsumowanie nie nadąża (np. błędy LLM), najstarsze oczekujące wiadomości są pomijane
+        max_pending = self.max_recent_messages * 4
+        if len(state.pending) > max_pending and (state.folding is None or state.folding.done()):
+            self._stats["dropped_messages"] += len(state.pending) - max_pending
+            del state.pending[:len(state.pending) - max_pending]
+        if state.pending and (state.folding is None or state.folding.done()):
+            state.folding = asyncio.create_task(self._fold(state))
+            self._tasks.add(state.folding)
+            state.folding.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, state: SessionState):
+        """Dołącza oczekujące wiadomości do podsumowania (w tle, poza ścieżką requestu)"""
+        while state.pending:
+            batch = list(state.pending)
+            try:
+                state.summary = await self.summarize(state.summary, batch)
+            except Exception as e:
+                logger.error(f"Error updating rolling summary: {e}")
+                self._stats["fold_errors"] += 1
+                return
+            del state.pending[:len(batch)]
+            self._stats["folds"] += 1
+            self._stats["folded_messages"] += len(batch)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self._stats,
+            "sessions": len(self._sessions),
+            "pending_messages": sum(len(state.pending) for state in self._sessions.values())
+        }
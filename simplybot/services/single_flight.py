@@ -0,0 +1,50 @@
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Łączy równoczesne identyczne wywołania w jedno wywołanie upstream.
+
+    Pierwsze wywołanie z danym kluczem uruchamia zadanie, kolejne (dopóki
+    zadanie trwa) czekają na ten sam wynik lub wyjątek. Zadanie nie jest
+    anulowane, gdy rozłączy się klient, który je rozpoczął - pozostali
+    nadal na nie czekają.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats = {"calls": 0, "upstream_calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Zwraca wynik func() współdzielony przez wszystkie równoczesne wywołania z tym kluczem"""
+        self._stats["calls"] += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+            logger.info(f"🔗 Coalesced {self.name} call (key: {key[:12]})")
+        else:
+            self._stats["upstream_calls"] += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        # shield - anulowanie jednego oczekującego nie przerywa wywołania pozostałym
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Odczyt wyjątku zapobiega ostrzeżeniu, gdy nikt już nie czeka na wynik
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            **self._stats,
+            "in_flight": len(self._in_flight),
+            "coalesced_rate": round(self._stats["coalesced"] / self._stats["calls"], 4) if self._stats["calls"] else 0.0
+        }
@@ -1,17 +1,37 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    PointStruct,
+    PointIdsList,
+    Filter,
+    FilterSelector,
+    FieldCondition,
+    MatchValue,
+    HasIdCondition,
+    PayloadSchemaType
+)
 from langchain_community.vectorstores import Qdrant
 from langchain_openai import OpenAIEmbeddings
 from sentence_transformers import SentenceTransformer
 from simplybot.config import Config
-from typing import List, Dict, Any
+from simplybot.services.embedding_cache import EmbeddingCache
+from simplybot.services.ingestion_manifest import CollectionVersion, ManifestStore
+from simplybot.services.single_flight import SingleFlight
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import logging
+import os
 import uuid
 import numpy as np
-import time
 
 logger = logging.getLogger(__name__)
 
+# Stała przestrzeń nazw dla deterministycznych ID punktów (uuid5)
+POINT_ID_NAMESPACE = uuid.UUID("5f0c6a8e-3b1d-4c9a-9a57-2f8e4d6b7c10")
+
 class VectorStoreService:
     def __init__(self):
         # Dla lokalnej instalacji Qdrant nie potrzebujemy API key
@@ -19,14 +39,56 @@ class VectorStoreService:
         if Config.QDRANT_API_KEY:
             client_kwargs["api_key"] = Config.QDRANT_API_KEY
         
-        self.client = QdrantClient(**client_kwargs)
+        if Config.QDRANT_TIMEOUT:
+            client_kwargs["timeout"] = Config.QDRANT_TIMEOUT
+        
+        # Jeden asynchroniczny klient (z pulą połączeń HTTP) współdzielony przez wszystkie requesty
+        self.client = AsyncQdrantClient(**client_kwargs)
+        
+        # Ograniczona pula wątków dla blokującego kodowania BGE
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, Config.EMBEDDING_WORKERS),
+            thread_name_prefix="embeddings"
+        )
         
         # Inicjalizacja embeddings
         self.embedding_model = Config.EMBEDDING_MODEL
         self.embeddings = self._initialize_embeddings()
+        self.embedding_model_name = Config.BGE_MODEL_NAME if self.embedding_model == "bge" else Config.OPENAI_EMBEDDING_MODEL
+        
+        # Cache embeddingów zapytań (pamięć + dysk)
+        self.embedding_cache = EmbeddingCache(
+            max_size=Config.EMBEDDING_CACHE_SIZE,
+            ttl_seconds=Config.EMBEDDING_CACHE_TTL,
+            db_path=Config.EMBEDDING_CACHE_PATH or None,
+            max_disk_rows=Config.EMBEDDING_CACHE_DISK_MAX_ROWS,
+            prune_interval=Config.EMBEDDING_CACHE_PRUNE_INTERVAL
+        )
+        self.single_flight = SingleFlight("embedding")
         
         self.collection_name = Config.QDRANT_COLLECTION_NAME
-        self._ensure_collection_exists()
+        self.last_ingest_stats: Dict[str, Any] = {}
+        self.manifests = ManifestStore(Config.MANIFEST_DIR)
+        # Rośnie przy każdej zmianie punktów - unieważnia cache odpowiedzi we wszystkich workerach
+        self._collection_version = CollectionVersion(
+            os.path.join(Config.MANIFEST_DIR, "collection_versions.sqlite3"),
+            self.collection_name
+        )
+    
+    async def get_collection_version(self) -> int:
+        return await asyncio.to_thread(self._collection_version.get)
+    
+    async def _bump_collection_version(self):
+        await asyncio.to_thread(self._collection_version.bump)
+    
+    async def initialize(self):
+        """Przygotowuje kolekcję - wywoływane przy starcie aplikacji"""
+        await self._ensure_collection_exists()
+    
+    async def close(self):
+        """Zamyka połączenie z Qdrant i pulę wątków"""
+        await self.client.close()
+        self._executor.shutdown(wait=False)
     
     def _initialize_embeddings(self):
         """Inicjalizuje model embeddings"""
@@ -44,13 +106,15 @@ class VectorStoreService:
             if Config.OPENAI_API_KEY:
                 return OpenAIEmbeddings(
                     api_key=Config.OPENAI_API_KEY,
-                    model=Config.OPENAI_EMBEDDING_MODEL
+                    model=Config.OPENAI_EMBEDDING_MODEL,
+                    chunk_size=Config.EMBEDDING_BATCH_SIZE
                 )
             elif Config.OPENROUTER_API_KEY:
                 return OpenAIEmbeddings(
                     api_key=Config.OPENROUTER_API_KEY,
                     base_url=Config.OPENROUTER_BASE_URL,
-                    model=Config.OPENAI_EMBEDDING_MODEL
+                    model=Config.OPENAI_EMBEDDING_MODEL,
+                    chunk_size=Config.EMBEDDING_BATCH_SIZE
                 )
             else:
                 raise ValueError("No API key for embeddings - set OPENAI_API_KEY or OPENROUTER_API_KEY")
@@ -67,36 +131,74 @@ class VectorStoreService:
             # OpenAI text-embedding-3-large ma 3072 wymiary
             return 3072
     
-    def _encode_text(self, text: str) -> List[float]:
-        """Koduje tekst na embeddings"""
+    def _prepare_bge_text(self, text: str) -> str:
+        """Dodaje prefiks wymagany przez BGE"""
+        if not text.startswith("Represent this sentence for searching relevant passages: "):
+            text = f"Represent this sentence for searching relevant passages: {text}"
+        return text
+    
+    async def _run_in_executor(self, func, *args):
+        """Uruchamia blokującą funkcję w puli wątków embeddings"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def _encode_text(self, text: str) -> List[float]:
+        """Koduje tekst na embeddings (z cache dla powtarzających się zapytań)"""
         # Logowanie tekstu do embedding
         text_preview = text[:10] + "..." if len(text) > 10 else text
         logger.info(f"🔍 Generating embedding for text: '{text_preview}' (length: {len(text)} characters)")
         
+        cache_key = EmbeddingCache.make_key(self.embedding_model, self.embedding_model_name, text)
+        cached = await self.embedding_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"⚡ Embedding z cache - wymiary: {len(cached)}")
+            return cached
+        
+        # Równoczesne zapytania o ten sam tekst czekają na jedno kodowanie
+        return await self.single_flight.do(cache_key, lambda: self._compute_embedding(text, cache_key))
+    
+    async def _compute_embedding(self, text: str, cache_key: str) -> List[float]:
         if self.embedding_model == "bge":
             # BGE wymaga specjalnego formatowania
-            if not text.startswith("Represent this sentence for searching relevant passages: "):
-                text = f"Represent this sentence for searching relevant passages: {text}"
-            
-            embedding = self.embeddings.encode(text)
+            embedding = await self._run_in_executor(self.embeddings.encode, self._prepare_bge_text(text))
+            embedding = embedding.tolist()
             logger.info(f"✅ BGE embedding wygenerowany - wymiary: {len(embedding)}")
-            return embedding.tolist()
         
         else:
             # OpenAI embeddings
-            embedding = self.embeddings.embed_query(text)
+            embedding = await self.embeddings.aembed_query(text)
             logger.info(f"✅ OpenAI embedding wygenerowany - wymiary: {len(embedding)}")
-            return embedding
+        
+        await self.embedding_cache.put(cache_key, embedding)
+        return embedding
+    
+    async def embed_query(self, text: str) -> List[float]:
+        """Zwraca embedding zapytania (z cache)"""
+        return await self._encode_text(text)
+    
+    async def encode_texts(self, texts: List[str]) -> List[List[float]]:
+        """Koduje listę tekstów na embeddings jednym wywołaniem"""
+        if self.embedding_model == "bge":
+            embeddings = await self._run_in_executor(
+                lambda: self.embeddings.encode(
+                    [self._prepare_bge_text(text) for text in texts],
+                    batch_size=Config.EMBEDDING_BATCH_SIZE
+                )
+            )
+            return embeddings.tolist()
+        
+        # OpenAI embeddings - embed_documents wysyła teksty w paczkach
+        return await self.embeddings.aembed_documents(texts)
     
-    def _ensure_collection_exists(self):
+    async def _ensure_collection_exists(self):
         """Upewnia się, że kolekcja istnieje"""
         try:
-            collections = self.client.get_collections()
+            collections = await self.client.get_collections()
             collection_names = [col.name for col in collections.collections]
             
             if self.collection_name not in collection_names:
                 embedding_dim = self._get_embedding_dimension()
-                self.client.create_collection(
+                await self.client.create_collection(
                     collection_name=self.collection_name,
                     vectors_config=VectorParams(
                         size=embedding_dim,
@@ -104,66 +206,129 @@ class VectorStoreService:
                     )
                 )
                 logger.info(f"Utworzono kolekcję: {self.collection_name} z wymiarami: {embedding_dim}")
+            
+            # Indeks na źródle przyspiesza usuwanie punktów pliku filtrem
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="metadata.source",
+                field_schema=PayloadSchemaType.KEYWORD
+            )
         except Exception as e:
             logger.error(f"Error creating collection: {e}")
     
-    async def add_documents(self, documents: List[Dict[str, Any]]) -> int:
-        """Adds documents to vector store"""
-        try:
-            added_count = 0
-            logger.info(f"📚 Starting to add {len(documents)} documents to vector store")
-            
-            for i, doc in enumerate(documents):
-                # Generate unique ID
-                doc_id = str(uuid.uuid4())
-                
-                # Log document information
-                content_preview = doc["content"][:10] + "..." if len(doc["content"]) > 10 else doc["content"]
-                logger.info(f"📄 Document {i+1}/{len(documents)}: '{content_preview}' (source: {doc.get('source', 'unknown')})")
-                
-                # Prepare metadata
-                metadata = {
-                    "source": doc.get("source", "unknown"),
-                    "title": doc.get("title", ""),
-                    "content_type": doc.get("content_type", "text"),
-                    "added_at": doc.get("added_at", "")
-                }
-                
-                # Dodaj punkt do Qdrant
-                point = PointStruct(
-                    id=doc_id,
-                    vector=self._encode_text(doc["content"]),
-                    payload={
-                        "content": doc["content"],  
-                        "metadata": metadata
-                    }
-                )
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=[point],
-                    wait=True
-                )
-                added_count += 1
-                logger.info(f"✅ Added document {i+1} to Qdrant (ID: {doc_id}...)")
-            
-            logger.info(f"🎉 Successfully added {added_count} documents to vector store")
-            return added_count
-            
-        except Exception as e:
-            logger.error(f"Error adding documents: {e}")
-            return 0
+    def build_point(self, point_id: str, content_hash: str, doc: Dict[str, Any], vector: List[float]) -> PointStruct:
+        """Buduje punkt Qdrant z fragmentu i jego wektora"""
+        metadata = {
+            "source": doc.get("source", "unknown"),
+            "title": doc.get("title", ""),
+            "content_type": doc.get("content_type", "text"),
+            "added_at": doc.get("added_at", ""),
+            "content_hash": content_hash
+        }
+        # Pozycja fragmentu pozwala łączyć sąsiednie fragmenty przy pakowaniu kontekstu
+        for key in ("page", "chunk"):
+            if doc.get(key) is not None:
+                metadata[key] = doc[key]
+        return PointStruct(
+            id=point_id,
+            vector=vector,
+            payload={
+                "content": doc["content"],
+                "metadata": metadata
+            }
+        )
+    
+    async def finalize_source(self, source: str, manifest: Dict[str, Any], new_chunks: Dict[str, str], file_hash: str) -> int:
+        """Deletes points of chunks no longer present in the source and saves its new manifest"""
+        old_chunks: Dict[str, str] = manifest.get("chunks", {})
+        if manifest:
+            stale_ids = [point_id for content_hash, point_id in old_chunks.items() if content_hash not in new_chunks]
+            await self._delete_points(stale_ids)
+            deleted_count = len(stale_ids)
+        else:
+            # No manifest yet (e.g. points indexed before manifests existed) - drop every other point of this source
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(filter=Filter(
+                    must=self._source_filter(source).must,
+                    must_not=[HasIdCondition(has_id=list(new_chunks.values()))]
+                )),
+                wait=True
+            )
+            deleted_count = 0
+        
+        self.manifests.save(source, file_hash, new_chunks)
+        await self._bump_collection_version()
+        return deleted_count
+    
+    async def delete_source(self, source: str):
+        """Deletes all points of a source file with one filtered delete"""
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=self._source_filter(source)),
+            wait=True
+        )
+        self.manifests.delete(source)
+        await self._bump_collection_version()
+        logger.info(f"🗑️ Deleted all points of source: {source}")
+    
+    @staticmethod
+    def _source_filter(source: str) -> Filter:
+        return Filter(must=[FieldCondition(key="metadata.source", match=MatchValue(value=source))])
+    
+    async def _delete_points(self, point_ids: List[str]):
+        """Usuwa punkty o podanych ID"""
+        if not point_ids:
+            return
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=point_ids),
+            wait=True
+        )
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        """Zwraca hash treści fragmentu"""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def make_point_id(source: str, content_hash: str) -> str:
+        """Deterministyczne ID punktu z (źródło, hash treści)"""
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\n{content_hash}"))
+    
+    async def get_existing_ids(self, point_ids: List[str]) -> set:
+        """Zwraca ID punktów, które już istnieją w kolekcji"""
+        if not point_ids:
+            return set()
+        records = await self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=point_ids,
+            with_payload=False,
+            with_vectors=False
+        )
+        return {str(record.id) for record in records}
+    
+    async def upsert_points(self, points: List[PointStruct], wait: bool):
+        """Zapisuje paczkę punktów w Qdrant"""
+        if not points:
+            return
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            points=points,
+            wait=wait
+        )
     
-    async def search_documents(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Searches for documents similar to query"""
+    async def search_documents(self, query: str, limit: int = 5, query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Searches for documents similar to query (query_vector skips embedding the query again)"""
         try:
             # Log RAG query
             query_preview = query[:10] + "..." if len(query) > 10 else query
             logger.info(f"🔍 RAG SEARCH: '{query_preview}' (limit: {limit})")
             
             # Search in Qdrant
-            search_result = self.client.search(
+            search_result = await self.client.search(
                 collection_name=self.collection_name,
-                query_vector=self._encode_text(query),
+                query_vector=query_vector or await self._encode_text(query),
                 limit=limit,
                 with_payload=True
             )
@@ -175,6 +340,7 @@ class VectorStoreService:
                 logger.info(f"📄 Result {i+1}: '{content_preview}' (score: {result.score:.4f})")
                 
                 doc = {
+                    "id": str(result.id),
                     "content": result.payload.get("content", ""),
                     "metadata": result.payload.get("metadata", {}),
                     "score": result.score
@@ -191,7 +357,7 @@ class VectorStoreService:
     async def get_collection_info(self) -> Dict[str, Any]:
         """Returns collection information"""
         try:
-            collection_info = self.client.get_collection(self.collection_name)
+            collection_info = await self.client.get_collection(self.collection_name)
             # Check if points_count is None and replace with 0
             points_count = collection_info.points_count if collection_info.points_count is not None else 0
             logger.info(f"📊 Collection information: {self.collection_name}, points: {points_count}")
@@ -199,6 +365,7 @@ class VectorStoreService:
             return {
                 "name": self.collection_name,
                 "points_count": points_count,
+                "last_ingest": self.last_ingest_stats,
                 "status": "ok"
             }
         except Exception as e:
@@ -0,0 +1,31 @@
+import pytest
+from simplybot.services.audio_store import RangeNotSatisfiableError, parse_byte_range
+
+SIZE = 100
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    # Niepoprawne składniowo lub nieobsługiwane - ignorowane, serwowany cały plik (200)
+    ("bytes=5-3", None),
+    ("bytes=-", None),
+    ("bytes=a-b", None),
+    ("bytes=--5", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-9", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, SIZE) == expected
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=-0", SIZE),
+    ("bytes=100-", SIZE),
+    ("bytes=100-200", SIZE),
+    ("bytes=-5", 0),
+])
+def test_parse_byte_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiableError):
+        parse_byte_range(header, size)
@@ -0,0 +1,86 @@
+import random
+import time
+from simplybot.services.chunker import TextChunker, get_token_counter
+
+def _generate_text(size_bytes: int) -> str:
+    """Generuje tekst z nagłówkami, akapitami i zdaniami o różnej długości"""
+    random.seed(42)
+    words = ["system", "projekt", "konfiguracja", "użytkownik", "dokument", "zadanie",
+             "raport", "serwer", "logowanie", "uprawnienia", "wersja", "moduł"]
+    parts = []
+    size = 0
+    section = 1
+    while size < size_bytes:
+        parts.append(f"{section}. Rozdział {section}\n")
+        for _ in range(random.randint(2, 6)):
+            sentences = []
+            for _ in range(random.randint(3, 10)):
+                sentence = " ".join(random.choice(words) for _ in range(random.randint(5, 30)))
+                sentences.append(sentence.capitalize() + random.choice([".", "!", "?", "."]))
+            parts.append(" ".join(sentences) + "\n\n")
+        size += sum(len(part) for part in parts[-7:])
+        section += 1
+    return "".join(parts)
+
+def test_chunker_boundaries():
+    """Test granic fragmentów: budżet tokenów, nakładanie i nagłówki"""
+    print("="*60)
+    print("TEST GRANIC FRAGMENTÓW")
+    print("="*60)
+
+    chunker = TextChunker(max_tokens=50, overlap_tokens=10)
+    text = _generate_text(20_000)
+    chunks = chunker.split(text)
+
+    too_long = [chunk for chunk in chunks if chunker.count_tokens(chunk) > chunker.max_tokens]
+    headings = [chunk for chunk in chunks if chunk.split(" ", 2)[1:2] == ["Rozdział"]]
+    lost_punctuation = "." not in "".join(chunks)
+
+    print(f"📦 Fragmentów: {len(chunks)}")
+    print(f"{'✅' if not too_long else '❌'} Fragmenty ponad budżet: {len(too_long)}")
+    print(f"{'✅' if headings else '❌'} Fragmenty zaczynające się od nagłówka: {len(headings)}")
+    print(f"{'✅' if not lost_punctuation else '❌'} Interpunkcja zachowana")
+
+def test_chunker_long_words():
+    """Test słów dłuższych niż budżet (URL, base64) - cięte po znakach, bez utraty treści"""
+    print("\n" + "="*60)
+    print("TEST DŁUGICH SŁÓW")
+    print("="*60)
+
+    chunker = TextChunker(max_tokens=40, overlap_tokens=0)
+    for name, text in [
+        ("jedno słowo", "A" * 5000),
+        ("URL w zdaniu", "Zobacz https://example.com/" + "x9" * 800 + " po szczegóły. Kolejne zdanie.")
+    ]:
+        chunks = chunker.split(text)
+        too_long = [chunk for chunk in chunks if chunker.count_tokens(chunk) > chunker.max_tokens]
+        print(f"{'✅' if not too_long else '❌'} {name}: {len(chunks)} fragmentów, ponad budżet: {len(too_long)}")
+        assert not too_long
+
+def benchmark_chunker():
+    """Mikro-benchmark chunkera na tekstach wielomegabajtowych"""
+    print("\n" + "="*60)
+    print("BENCHMARK CHUNKERA")
+    print("="*60)
+
+    for name, count_tokens in [("przybliżony", None), ("tokenizer modelu", get_token_counter())]:
+        chunker = TextChunker(max_tokens=256, overlap_tokens=32, count_tokens=count_tokens)
+        for megabytes in [1, 2, 4, 8]:
+            text = _generate_text(megabytes * 1024 * 1024)
+            started_at = time.perf_counter()
+            chunks = chunker.split(text)
+            elapsed = time.perf_counter() - started_at
+            # Przy liniowej złożoności MB/s pozostaje stałe niezależnie od rozmiaru
+            print(
+                f"⏱️ {name}: {megabytes} MB -> {len(chunks)} fragmentów w {elapsed:.2f}s "
+                f"({megabytes / elapsed:.2f} MB/s)"
+            )
+
+if __name__ == "__main__":
+    test_chunker_boundaries()
+    test_chunker_long_words()
+    benchmark_chunker()
+
+    print("\n" + "="*60)
+    print("✅ TESTY ZAKOŃCZONE")
+    print("="*60)
@@ -0,0 +1,70 @@
+import requests
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+API_BASE_URL = "http://localhost:8000"
+
+def _timed_request(payload):
+    """Wysyła jedno zapytanie i zwraca (czas w sekundach, status)"""
+    started_at = time.perf_counter()
+    try:
+        response = requests.post(f"{API_BASE_URL}/get_more_information", json=payload, timeout=120)
+        status = response.status_code
+    except Exception as e:
+        status = str(e)
+    return time.perf_counter() - started_at, status
+
+def _percentile(values, percent):
+    """Zwraca percentyl z posortowanej listy"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def test_get_more_information_concurrency():
+    """Test latencji /get_more_information przy rosnącej liczbie równoległych klientów"""
+    print("="*60)
+    print("TEST WSPÓŁBIEŻNOŚCI /get_more_information")
+    print("="*60)
+
+    payload = {
+        "conversation": {
+            "messages": [
+                {"role": "user", "content": "Jakie są główne funkcje SimplyProject?"}
+            ],
+            "session_id": "concurrency_test"
+        }
+    }
+
+    results = {}
+    for clients in [1, 2, 4, 8, 16, 32, 64]:
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            # Każdy klient wysyła 2 zapytania, żeby wyrównać rozgrzewkę
+            timings = list(executor.map(_timed_request, [payload] * clients * 2))
+
+        latencies = [elapsed for elapsed, status in timings if status == 200]
+        errors = len(timings) - len(latencies)
+        if not latencies:
+            print(f"❌ {clients:>2} klientów: wszystkie zapytania zakończone błędem ({timings[0][1]})")
+            continue
+
+        results[clients] = statistics.median(latencies)
+        print(
+            f"👥 {clients:>2} klientów: p50={statistics.median(latencies):.3f}s "
+            f"p95={_percentile(latencies, 95):.3f}s błędy={errors}"
+        )
+
+    if 1 in results and 64 in results:
+        ratio = results[64] / results[1]
+        # Przy nieblokującym event loopie p50 nie powinno rosnąć liniowo z liczbą klientów
+        if ratio < 2.0:
+            print(f"✅ Latencja stabilna (p50 x{ratio:.2f} przy 64 klientach)")
+        else:
+            print(f"⚠️ Latencja rośnie wraz z liczbą klientów (p50 x{ratio:.2f} przy 64 klientach)")
+
+if __name__ == "__main__":
+    test_get_more_information_concurrency()
+
+    print("\n" + "="*60)
+    print("✅ TEST ZAKOŃCZONY")
+    print("="*60)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from langchain_openai import ChatOpenAI
+from simplybot.services.resilience import ResilienceLayer, UpstreamUnavailableError
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Lokalny serwer zgodny z /v1/chat/completions - kolejne odpowiedzi biorą się ze `script`"""
+
+    # Lista (status, opóźnienie w sekundach); po jej wyczerpaniu: 200 bez opóźnienia
+    script = []
+    lock = threading.Lock()
+    requests = 0
+    concurrent = 0
+    max_concurrent = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = StubOpenAIHandler
+        with cls.lock:
+            cls.requests += 1
+            cls.concurrent += 1
+            cls.max_concurrent = max(cls.max_concurrent, cls.concurrent)
+            status, delay = cls.script.pop(0) if cls.script else (200, 0.0)
+        try:
+            time.sleep(delay)
+            if status == 200:
+                body = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "stub",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+                }
+            else:
+                body = {"error": {"message": f"stub error {status}", "type": "stub", "code": status}}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with cls.lock:
+                cls.concurrent -= 1
+
+def _reset_stub(script):
+    StubOpenAIHandler.script = list(script)
+    StubOpenAIHandler.requests = 0
+    StubOpenAIHandler.max_concurrent = 0
+
+def _start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _make_llm(server):
+    return ChatOpenAI(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        model="stub",
+        max_retries=0,
+        timeout=10
+    )
+
+def test_retries_on_rate_limit():
+    """429 i 5xx są ponawiane, a tempo token bucketu spada po 429"""
+    server = _start_stub_server()
+    try:
+        llm = _make_llm(server)
+        layer = ResilienceLayer("stub", rate_per_second=50, burst=5, max_retries=3, base_delay=0.01, max_delay=0.05)
+        _reset_stub([(429, 0.0), (503, 0.0)])
+
+        response = asyncio.run(layer.call("answer", lambda: llm.ainvoke("hi")))
+        stats = layer.get_stats()
+        assert response.content == "ok"
+        assert StubOpenAIHandler.requests == 3
+        assert stats["retries"] == 2 and stats["throttled"] == 1
+        assert stats["rate_per_second"] < 50
+        print(f"✅ Ponowienia: {stats['retries']}, tempo po 429: {stats['rate_per_second']} req/s")
+    finally:
+        server.shutdown()
+
+def test_gives_up_after_max_retries():
+    """Po ostatniej próbie zgłaszany jest UpstreamUnavailableError, a błędy 4xx nie są ponawiane"""
+    server = _start_stub_server()
+    try:
+        llm = _make_llm(server)
+        layer = ResilienceLayer("stub", max_retries=2, base_delay=0.01, max_delay=0.05)
+
+        _reset_stub([(500, 0.0)] * 3)
+        try:
+            asyncio.run(layer.call("answer", lambda: llm.ainvoke("hi")))
+            raise AssertionError("expected UpstreamUnavailableError")
+        except UpstreamUnavailableError:
+            pass
+        assert StubOpenAIHandler.requests == 3
+
+        _reset_stub([(400, 0.0)])
+        try:
+            asyncio.run(layer.call("answer", lambda: llm.ainvoke("hi")))
+            raise AssertionError("expected a client error")
+        except UpstreamUnavailableError:
+            raise AssertionError("4xx must not be retried")
+        except Exception:
+            pass
+        assert StubOpenAIHandler.requests == 1
+        print("✅ Błędy trwałe nie są ponawiane, przejściowe kończą się UpstreamUnavailableError")
+    finally:
+        server.shutdown()
+
+def test_concurrency_limit():
+    """Semafor ogranicza liczbę równoczesnych zapytań do dostawcy"""
+    server = _start_stub_server()
+    try:
+        llm = _make_llm(server)
+        layer = ResilienceLayer("stub", max_concurrency=2)
+        _reset_stub([(200, 0.1)] * 8)
+
+        async def burst():
+            return await asyncio.gather(*[layer.call("answer", lambda: llm.ainvoke("hi")) for _ in range(8)])
+
+        asyncio.run(burst())
+        assert StubOpenAIHandler.max_concurrent <= 2
+        print(f"✅ Maksymalnie {StubOpenAIHandler.max_concurrent} równoczesne zapytania przy limicie 2")
+    finally:
+        server.shutdown()
+
+def test_hedged_request():
+    """Wolna odpowiedź (powyżej p95) jest wyprzedzana przez drugie zapytanie"""
+    server = _start_stub_server()
+    try:
+        llm = _make_llm(server)
+        layer = ResilienceLayer("stub", hedging=True, hedge_min_delay=0.05, hedge_min_samples=5)
+
+        async def run():
+            for _ in range(5):
+                await layer.call("answer", lambda: llm.ainvoke("hi"))
+            _reset_stub([(200, 2.0)])
+            started_at = time.perf_counter()
+            await layer.call("answer", lambda: llm.ainvoke("hi"))
+            return time.perf_counter() - started_at
+
+        _reset_stub([])
+        elapsed = asyncio.run(run())
+        stats = layer.get_stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+        assert elapsed < 1.0
+        print(f"✅ Hedging: odpowiedź po {elapsed * 1000:.0f} ms zamiast ~2000 ms")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    print("="*60)
+    print("TEST WARSTWY ODPORNOŚCI LLM (lokalny serwer stub)")
+    print("="*60)
+
+    test_retries_on_rate_limit()
+    test_gives_up_after_max_retries()
+    test_concurrency_limit()
+    test_hedged_request()
+
+    print("\n" + "="*60)
+    print("✅ TEST ZAKOŃCZONY")
+    print("="*60)